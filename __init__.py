@@ -15,8 +15,16 @@ from . import agent
 
 # Expose root_agent for ADK
 # ADK looks for root_agent in CarMecanicAgent.root_agent or CarMecanicAgent.agent.root_agent
-# Initialize root_agent - this will raise an error if configuration is missing
-root_agent = agent._initialize_root_agent()
+# root_agent is created lazily (PEP 562) on first access, so importing the package
+# doesn't load the index or the ADK runtime. Raises an error if configuration is missing.
+def __getattr__(name):
+    if name == "root_agent":
+        root_agent = agent._initialize_root_agent()
+        # Cache on the package so later accesses skip this hook
+        globals()["root_agent"] = root_agent
+        return root_agent
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-# Also expose in agent module for CarMecanicAgent.agent.root_agent
-agent.root_agent = root_agent
+
+def __dir__():
+    return sorted(set(globals()) | {"root_agent"})
@@ -3,106 +3,21 @@ Main ADK agent for mechanical vehicle queries.
 Integrates PDF manual search and internet search.
 """
 import os
+import sys
 import asyncio
-from typing import Optional, Any
-from google.adk.agents import Agent
-from google.adk.runners import Runner
-from google.adk.sessions import InMemorySessionService
-from google.genai import types
+import inspect
+from functools import lru_cache
+from typing import TYPE_CHECKING, AsyncIterator, Iterator, Tuple
 
-from config import Config
-from agent_tools import setup_tools, get_tools, TOOL_FUNCTIONS
+from config import Config, load_env
+from agent_tools import setup_tools, get_tools, TOOL_FUNCTIONS, ASYNC_TOOL_FUNCTIONS
 
+if TYPE_CHECKING:
+    from google.genai import types
 
-class MechanicalAgent:
-    """Mechanical agent using ADK with Gemini."""
-    
-    def __init__(self, model: str = None):
-        """
-        Initializes the mechanical agent.
-        
-        Args:
-            model: Gemini model to use (defaults to Config.LLM_MODEL if not provided)
-        """
-        # Use configured model if not provided
-        if model is None:
-            model = Config.LLM_MODEL
-        # Verify API key
-        if not Config.GOOGLE_API_KEY:
-            raise ValueError(
-                "GOOGLE_API_KEY not found. "
-                "Configure it as an environment variable."
-            )
-        
-        # Verify vehicle configuration
-        if Config.vehicle is None:
-            raise ValueError(
-                "Vehicle not configured. "
-                "Use Config.set_vehicle() before initializing the agent."
-            )
-        
-        # Configure API key
-        os.environ["GOOGLE_API_KEY"] = Config.GOOGLE_API_KEY
-        
-        # Initialize tools
-        setup_tools()
-        
-        # Create ADK agent
-        self.agent = Agent(
-            name="MechanicalAgent",
-            model=model,
-            description=(
-                f"Agent specialized in vehicle diagnosis and repair. "
-                f"Expert on vehicle: {Config.get_vehicle_info()}. "
-                "Uses the service manual as the primary source of information."
-            ),
-            tools=get_tools(),
-            instruction=self._get_instruction()
-        )
-        
-        # Create runner with session
-        self.session_service = InMemorySessionService()
-        self.app_name = "mechanical_agent"
-        self.default_user_id = "user"
-        self.runner = Runner(
-            agent=self.agent,
-            app_name=self.app_name,
-            session_service=self.session_service
-        )
-        
-        # Save reference to tool functions for later use
-        self.tool_functions = TOOL_FUNCTIONS
-        
-        print(f"✅ Mechanical agent initialized for {Config.get_vehicle_info()}")
-    
-    def _ensure_session(self, session_id: str, user_id: str = None):
-        """Ensures the session exists, creating it if necessary."""
-        user_id = user_id or self.default_user_id
-        import asyncio
-        
-        async def create_session_async():
-            try:
-                await self.session_service.create_session(
-                    app_name=self.app_name,
-                    user_id=user_id,
-                    session_id=session_id
-                )
-            except Exception:
-                # Session already exists or other error, continue
-                pass
-        
-        # Create session if it doesn't exist
-        try:
-            asyncio.run(create_session_async())
-        except Exception:
-            pass
-    
-    def _get_instruction(self) -> str:
-        """Generates agent instructions."""
-        vehicle_info = Config.get_vehicle_info()
-        aftermarket_mods_info = Config.get_aftermarket_mods_info()
-        
-        return f"""
+
+# Static instruction scaffold; vehicle-specific parts are filled in by _format_instruction()
+_INSTRUCTION_TEMPLATE = """
 You are a mechanical expert specialized in vehicle diagnosis and repair. You provide precise and direct technical information from the service manual.
 
 VEHICLE INFORMATION:
@@ -197,98 +112,290 @@ OPERATING INSTRUCTIONS:
    - Use technical terms in English (brake pads, caliper, etc.) in addition to other languages
 
 7. **Aftermarket Modifications**
-{f"   - IMPORTANT: The vehicle has the following aftermarket modifications installed:" + "\n" + "\n".join(f"     • {mod}" for mod in Config.get_aftermarket_modifications()) + "\n   - Consider these modifications when diagnosing problems or providing recommendations" + "\n   - Some procedures in the manual may need to be adapted due to these modifications" + "\n   - When relevant, mention how aftermarket parts might affect the diagnosis or procedure" if Config.get_aftermarket_modifications() else "   - No aftermarket modifications configured for this vehicle"}
+{aftermarket_section}
 """
+
+
+@lru_cache(maxsize=8)
+def _format_instruction(vehicle_info: str, aftermarket_mods_info: str,
+                        aftermarket_mods: Tuple[str, ...]) -> str:
+    """Formats the instruction template once per unique vehicle configuration."""
+    if aftermarket_mods:
+        aftermarket_section = "\n".join(
+            ["   - IMPORTANT: The vehicle has the following aftermarket modifications installed:"]
+            + [f"     • {mod}" for mod in aftermarket_mods]
+            + [
+                "   - Consider these modifications when diagnosing problems or providing recommendations",
+                "   - Some procedures in the manual may need to be adapted due to these modifications",
+                "   - When relevant, mention how aftermarket parts might affect the diagnosis or procedure",
+            ]
+        )
+    else:
+        aftermarket_section = "   - No aftermarket modifications configured for this vehicle"
     
-    def query(self, query: str, session_id: str = "default", user_id: str = None) -> str:
+    return _INSTRUCTION_TEMPLATE.format(
+        vehicle_info=vehicle_info,
+        aftermarket_mods_info=aftermarket_mods_info,
+        aftermarket_section=aftermarket_section
+    )
+
+
+class MechanicalAgent:
+    """Mechanical agent using ADK with Gemini."""
+    
+    def __init__(self, model: str = None):
         """
-        Processes a user query.
+        Initializes the mechanical agent.
+        
+        Args:
+            model: Gemini model to use (defaults to Config.LLM_MODEL if not provided)
+        """
+        # Use configured model if not provided
+        if model is None:
+            model = Config.LLM_MODEL
+        # Verify API key
+        if not Config.GOOGLE_API_KEY:
+            raise ValueError(
+                "GOOGLE_API_KEY not found. "
+                "Configure it as an environment variable."
+            )
+        
+        # Verify vehicle configuration
+        if Config.vehicle is None:
+            raise ValueError(
+                "Vehicle not configured. "
+                "Use Config.set_vehicle() before initializing the agent."
+            )
+        
+        # ADK reads the API key from the environment; load_dotenv() has usually
+        # set it already, so only write it when Config holds a different key
+        if os.environ.get("GOOGLE_API_KEY") != Config.GOOGLE_API_KEY:
+            os.environ["GOOGLE_API_KEY"] = Config.GOOGLE_API_KEY
+        
+        # Imported here so importing this module doesn't pay the ADK import cost
+        from google.adk.agents import Agent
+        from google.adk.runners import Runner
+        from google.adk.sessions import InMemorySessionService
+        
+        # Initialize tools
+        setup_tools()
+        
+        # Create ADK agent
+        self.agent = Agent(
+            name="MechanicalAgent",
+            model=model,
+            description=(
+                f"Agent specialized in vehicle diagnosis and repair. "
+                f"Expert on vehicle: {Config.get_vehicle_info()}. "
+                "Uses the service manual as the primary source of information."
+            ),
+            tools=get_tools(),
+            instruction=self._get_instruction()
+        )
+        
+        # Create runner with session
+        self.session_service = InMemorySessionService()
+        self.app_name = "mechanical_agent"
+        self.default_user_id = "user"
+        self.runner = Runner(
+            agent=self.agent,
+            app_name=self.app_name,
+            session_service=self.session_service
+        )
+        
+        # Save reference to tool functions for later use
+        self.tool_functions = TOOL_FUNCTIONS
+        # Dispatch table for function calls (the tool set is fixed); coroutine
+        # variants are preferred so they run on the current loop instead of
+        # starting a new one per call
+        self._dispatch = {**TOOL_FUNCTIONS, **ASYNC_TOOL_FUNCTIONS}
+        
+        # Persistent event loop reused by the synchronous query() wrapper
+        self._loop = asyncio.new_event_loop()
+        
+        print(f"✅ Mechanical agent initialized for {Config.get_vehicle_info()}")
+    
+    async def _ensure_session(self, session_id: str, user_id: str = None):
+        """Ensures the session exists, creating it if necessary."""
+        user_id = user_id or self.default_user_id
+        try:
+            await self.session_service.create_session(
+                app_name=self.app_name,
+                user_id=user_id,
+                session_id=session_id
+            )
+        except Exception:
+            # Session already exists or other error, continue
+            pass
+    
+    @staticmethod
+    def _build_content(query: str) -> "types.Content":
+        """Wraps a user query in the ADK message format."""
+        from google.genai import types
+        
+        return types.Content(
+            role='user',
+            parts=[types.Part(text=query)]
+        )
+    
+    def _get_instruction(self) -> str:
+        """Generates agent instructions."""
+        return _format_instruction(
+            Config.get_vehicle_info(),
+            Config.get_aftermarket_mods_info(),
+            Config.get_aftermarket_modifications()
+        )
+    
+    async def astream(self, query: str, session_id: str = "default",
+                      user_id: str = None) -> AsyncIterator[str]:
+        """
+        Processes a user query, yielding response text as it arrives.
+        
+        The runner streams partial model output (SSE); partial chunks are yielded
+        immediately and the aggregated final event is only used when nothing
+        was streamed for it. Text the model streams before calling a tool
+        (e.g. "Let me check the manual") is shown too; each model response
+        starts on a new line.
         
         Args:
             query: User question about the vehicle
             session_id: Session ID to maintain context
             user_id: User ID (optional, uses default if not provided)
             
-        Returns:
-            Agent response
+        Yields:
+            Chunks of the agent response
         """
+        from google.adk.agents.run_config import RunConfig, StreamingMode
+        
         user_id = user_id or self.default_user_id
         
         try:
             # Ensure session exists
-            self._ensure_session(session_id, user_id)
+            await self._ensure_session(session_id, user_id)
             
             # Prepare message in ADK format
-            content = types.Content(
-                role='user',
-                parts=[types.Part(text=query)]
-            )
+            content = self._build_content(query)
             
-            # Execute query using run_async synchronously
-            final_response = "No response received from agent."
-            
-            # Use run_async in event loop
-            import asyncio
-            
-            async def run_query():
+            has_output = False
+            streamed = False  # Partial text already yielded for the current response
+            async for event in self.runner.run_async(
+                user_id=user_id,
+                session_id=session_id,
+                new_message=content,
+                run_config=RunConfig(streaming_mode=StreamingMode.SSE)
+            ):
+                content = getattr(event, 'content', None)
+                parts = getattr(content, 'parts', None) if content else None
+                
+                # Handle function calls and collect text parts of the event
                 text_parts = []
-                async for event in self.runner.run_async(
-                    user_id=user_id,
-                    session_id=session_id,
-                    new_message=content
-                ):
-                    # Handle function calls if they exist
-                    if hasattr(event, 'content') and event.content:
-                        if hasattr(event.content, 'parts') and event.content.parts:
-                            for part in event.content.parts:
-                                # If there's a function_call, execute it manually
-                                if hasattr(part, 'function_call') and part.function_call:
-                                    func_name = part.function_call.name
-                                    # Extract arguments
-                                    func_args = {}
-                                    if hasattr(part.function_call, 'args'):
-                                        args_obj = part.function_call.args
-                                        if isinstance(args_obj, dict):
-                                            func_args = args_obj
-                                        elif hasattr(args_obj, '__dict__'):
-                                            func_args = args_obj.__dict__
-                                        # Try to extract 'query' if it exists
-                                        if 'query' not in func_args and hasattr(args_obj, 'query'):
-                                            func_args['query'] = args_obj.query
-                                    
-                                    # Execute function if it exists
-                                    if func_name in self.tool_functions:
-                                        try:
-                                            # Execute the function
-                                            result = self.tool_functions[func_name](**func_args)
-                                            # Result will be handled in the next iteration
-                                            # ADK should include the result in the final response
-                                        except Exception as e:
-                                            print(f"⚠️ Error executing function {func_name}: {e}")
-                    
-                    # Get final response
-                    if hasattr(event, 'is_final_response') and event.is_final_response():
-                        if hasattr(event, 'content') and event.content:
-                            if hasattr(event.content, 'parts') and event.content.parts:
-                                # Collect all text parts
-                                for part in event.content.parts:
-                                    if hasattr(part, 'text') and part.text:
-                                        text_parts.append(part.text)
-                            elif hasattr(event.content, 'text'):
-                                text_parts.append(event.content.text)
+                if parts:
+                    for part in parts:
+                        # If there's a function_call, execute it manually
+                        function_call = getattr(part, 'function_call', None)
+                        if function_call:
+                            tool = self._dispatch.get(function_call.name)
+                            if tool is not None:
+                                func_args = dict(function_call.args) if function_call.args else {}
+                                try:
+                                    # Result will be handled in the next iteration
+                                    # ADK should include the result in the final response
+                                    try:
+                                        result = tool(**func_args)
+                                    except TypeError:
+                                        # Unexpected argument names: all tools take a single query
+                                        result = tool(func_args.get('query', ''))
+                                    if inspect.isawaitable(result):
+                                        await result
+                                except Exception as e:
+                                    print(f"⚠️ Error executing function {function_call.name}: {e}")
+                        
+                        text = getattr(part, 'text', None)
+                        if text:
+                            text_parts.append(text)
+                elif content:
+                    text = getattr(content, 'text', None)
+                    if text:
+                        text_parts.append(text)
                 
-                # Return all text parts concatenated
-                if text_parts:
-                    return "\n".join(text_parts)
-                return final_response
-            
-            # Execute async function
-            final_response = asyncio.run(run_query())
+                # Partial (streamed) chunk: yield it right away, separating a new
+                # response from the text already shown
+                if getattr(event, 'partial', False):
+                    if text_parts:
+                        separator = "\n" if has_output and not streamed else ""
+                        streamed = True
+                        has_output = True
+                        yield separator + "".join(text_parts)
+                    continue
+                
+                # Get final response, unless it was already streamed
+                is_final_response = getattr(event, 'is_final_response', None)
+                if is_final_response and is_final_response():
+                    if text_parts and not streamed:
+                        yield ("\n" if has_output else "") + "\n".join(text_parts)
+                        has_output = True
+                streamed = False
             
-            return final_response
+            if not has_output:
+                yield "No response received from agent."
                 
         except Exception as e:
-            return f"Error processing query: {str(e)}"
+            yield f"Error processing query: {str(e)}"
+    
+    async def aquery(self, query: str, session_id: str = "default", user_id: str = None) -> str:
+        """
+        Processes a user query asynchronously.
+        
+        Args:
+            query: User question about the vehicle
+            session_id: Session ID to maintain context
+            user_id: User ID (optional, uses default if not provided)
+            
+        Returns:
+            Agent response
+        """
+        return "".join([chunk async for chunk in self.astream(query, session_id, user_id)])
+    
+    def stream(self, query: str, session_id: str = "default", user_id: str = None) -> Iterator[str]:
+        """
+        Processes a user query, yielding response text as it arrives.
+        
+        Drives astream() on the agent's persistent event loop.
+        
+        Args:
+            query: User question about the vehicle
+            session_id: Session ID to maintain context
+            user_id: User ID (optional, uses default if not provided)
+            
+        Yields:
+            Chunks of the agent response
+        """
+        chunks = self.astream(query, session_id, user_id)
+        try:
+            while True:
+                try:
+                    yield self._loop.run_until_complete(chunks.__anext__())
+                except StopAsyncIteration:
+                    break
+        finally:
+            self._loop.run_until_complete(chunks.aclose())
+    
+    def query(self, query: str, session_id: str = "default", user_id: str = None) -> str:
+        """
+        Processes a user query.
+        
+        Runs on the agent's persistent event loop, so no loop is created and
+        torn down per user turn.
+        
+        Args:
+            query: User question about the vehicle
+            session_id: Session ID to maintain context
+            user_id: User ID (optional, uses default if not provided)
+            
+        Returns:
+            Agent response
+        """
+        return "".join(self.stream(query, session_id, user_id))
     
     def chat(self, session_id: str = "default"):
         """
@@ -315,9 +422,16 @@ OPERATING INSTRUCTIONS:
                     continue
                 
                 print("\n🤖 Agent: ", end="", flush=True)
-                response = self.query(query, session_id)
-                print(response)
-                print()
+                # Flush per line (or every ~256 chars) instead of per chunk
+                pending = 0
+                for chunk in self.stream(query, session_id):
+                    sys.stdout.write(chunk)
+                    pending += len(chunk)
+                    if "\n" in chunk or pending > 256:
+                        sys.stdout.flush()
+                        pending = 0
+                sys.stdout.write("\n\n")
+                sys.stdout.flush()
                 
             except KeyboardInterrupt:
                 print("\n\n👋 Goodbye!")
@@ -337,19 +451,10 @@ def get_root_agent():
     Raises:
         ValueError: If configuration is missing (API key, vehicle info, etc.)
     """
-    # Load configuration from .env
-    # Try to load from package directory first, then current directory
-    from dotenv import load_dotenv
-    from pathlib import Path
-    
-    package_dir = Path(__file__).parent
-    env_path = package_dir / ".env"
-    
-    # Load .env from package directory if it exists, otherwise try current directory
-    if env_path.exists():
-        load_dotenv(env_path)
-    else:
-        load_dotenv()  # Try current directory
+    # Load configuration from .env (package directory first, then current directory).
+    # Already done when config was imported; this is a no-op after the first call.
+    load_env()
+    env_path = Config.BASE_DIR / ".env"
     
     # Load vehicle configuration
     if Config.vehicle is None:
@@ -372,11 +477,18 @@ def get_root_agent():
 
 
 # Expose root_agent for ADK
-root_agent = None
+# Created on first access (PEP 562), so importing this module stays cheap
+_root_agent = None
 
 def _initialize_root_agent():
     """Lazy initialization of root_agent."""
-    global root_agent
-    if root_agent is None:
-        root_agent = get_root_agent()
-    return root_agent
+    global _root_agent
+    if _root_agent is None:
+        _root_agent = get_root_agent()
+    return _root_agent
+
+
+def __getattr__(name):
+    if name == "root_agent":
+        return _initialize_root_agent()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -2,34 +2,101 @@
 Custom tools for the ADK agent.
 Includes manual search and internet search.
 """
-from typing import List, Dict, Optional
+import asyncio
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Optional
+
+import numpy as np
 
-from pdf_indexer import PDFIndexer
-from internet_search import InternetSearch
 from config import Config
+from query_cache import QueryCache, SemanticQueryCache, normalize_query, query_terms
+
+if TYPE_CHECKING:
+    from pdf_indexer import PDFIndexer
+    from internet_search import InternetSearch
 
 
 # Global instances (initialized in setup_tools)
-pdf_indexer: Optional[PDFIndexer] = None
-internet_searcher: Optional[InternetSearch] = None
+pdf_indexer: Optional["PDFIndexer"] = None
+internet_searcher: Optional["InternetSearch"] = None
+
+# Common Spanish terms and their English equivalents used in the manual
+_EN_TERMS = {
+    'pastillas': 'brake pads',
+    'frenos': 'brake',
+    'caliper': 'caliper',
+    'cáliper': 'caliper',
+    'cambio': 'replace replacement',
+    'reemplazo': 'replace replacement',
+    'delantero': 'front',
+    'trasero': 'rear'
+}
+_EN_TRIGGERS = frozenset(_EN_TERMS)
+_WORD_RE = re.compile(r"\w+")
+
+# Manual response caches: exact normalized query, plus near-duplicate queries
+# (internet results are cached by InternetSearch itself)
+_manual_cache = QueryCache(maxsize=Config.QUERY_CACHE_SIZE)
+_manual_semantic_cache = SemanticQueryCache(
+    maxsize=Config.QUERY_CACHE_SIZE,
+    threshold=Config.SEMANTIC_CACHE_THRESHOLD
+)
 
 
-def setup_tools():
-    """Initializes agent tools."""
+def setup_tools(force: bool = False):
+    """
+    Initializes agent tools.
+    
+    Repeated calls in the same process reuse the already initialized tools
+    (the embedding model and index are loaded only once).
+    
+    Args:
+        force: Recreate the tools even if they are already initialized
+    """
     global pdf_indexer, internet_searcher
     
+    # Heavy dependencies (FAISS, sentence-transformers, google-genai) are
+    # imported on first use rather than when this module is imported
+    from pdf_indexer import PDFIndexer
+    from internet_search import InternetSearch
+    
+    if not force and pdf_indexer is not None and pdf_indexer.index is not None \
+            and internet_searcher is not None:
+        return
+    
     # Initialize PDF indexer
-    pdf_indexer = PDFIndexer()
-    if Config.INDEX_PATH.exists():
-        pdf_indexer.load_index()
-    else:
-        print("⚠️ Index not found. Run build_index() first.")
+    if force or pdf_indexer is None:
+        pdf_indexer = PDFIndexer()
+    if pdf_indexer.index is None:
+        if Config.INDEX_PATH.exists():
+            pdf_indexer.load_index()
+        else:
+            print("⚠️ Index not found. Run build_index() first.")
     
     # Initialize internet searcher
-    internet_searcher = InternetSearch()
+    if force or internet_searcher is None:
+        internet_searcher = InternetSearch()
+    
+    # In-memory responses belong to the previous index/searcher (the on-disk
+    # search cache is kept so it is reused across runs)
+    clear_caches()
 
 
-def search_manual(query: str) -> str:
+def clear_caches(persistent: bool = False):
+    """
+    Clears the cached tool responses.
+    
+    Args:
+        persistent: Also wipe the on-disk internet search cache kept across runs
+    """
+    _manual_cache.clear()
+    _manual_semantic_cache.clear()
+    if internet_searcher is not None:
+        internet_searcher.cache_clear(persistent=persistent)
+
+
+async def asearch_manual(query: str) -> str:
     """
     Searches for technical information in the vehicle service manual.
     
@@ -45,87 +112,161 @@ def search_manual(query: str) -> str:
     if pdf_indexer is None:
         return "Error: PDF indexer is not initialized."
     
+    # Results depend on the configured vehicle (manual), so it is part of the key
+    vehicle_info = Config.get_vehicle_info()
+    cache_key = (vehicle_info, normalize_query(query))
+    cached = _manual_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    
     try:
-        # Perform multiple searches with variations
+        # Near-duplicate queries reuse a cached response without searching the index.
+        # Only rewordings with the same content words match, so a query differing
+        # in a key term ("front" vs "rear") never gets the other's answer
+        query_embedding = None
+        semantic_key = (vehicle_info, query_terms(query))
+        if _manual_semantic_cache.maxsize > 0:
+            query_embedding = await asyncio.to_thread(pdf_indexer.encode_query, query)
+            cached = _manual_semantic_cache.get(query_embedding, key=semantic_key)
+            if cached is not None:
+                _manual_cache.put(cache_key, cached)
+                return cached
+        
+        # English equivalents of Spanish triggers in the query (terms that are
+        # already English, like "caliper", add nothing new)
+        tokens = set(_WORD_RE.findall(query.lower()))
+        extra = list(dict.fromkeys(
+            _EN_TERMS[term] for term in tokens & _EN_TRIGGERS if _EN_TERMS[term] != term
+        ))
+        
+        # Original search plus an English-only variant, run concurrently.
+        # The English variant complements the original instead of re-embedding
+        # a near-identical string; it is skipped when there is nothing to add.
+        searches = [pdf_indexer.asearch_hybrid(query, top_k=Config.TOP_K_RESULTS * 2)]
+        if extra:
+            searches.append(pdf_indexer.asearch_hybrid(" ".join(extra), top_k=Config.TOP_K_RESULTS))
+        
         all_results = []
+        for results in await asyncio.gather(*searches):
+            all_results.extend(results)
         
-        # Original search
-        results = pdf_indexer.search_hybrid(query, top_k=Config.TOP_K_RESULTS * 2)
-        all_results.extend(results)
-        
-        # Search with common English terms
-        english_terms = {
-            'pastillas': 'brake pads',
-            'frenos': 'brake',
-            'caliper': 'caliper',
-            'cáliper': 'caliper',
-            'cambio': 'replace replacement',
-            'reemplazo': 'replace replacement',
-            'delantero': 'front',
-            'trasero': 'rear'
-        }
-        
-        # Add English terms if they are in the query
-        enhanced_query = query
-        for es_term, en_term in english_terms.items():
-            if es_term.lower() in query.lower():
-                enhanced_query += f" {en_term}"
-        
-        if enhanced_query != query:
-            results_en = pdf_indexer.search_hybrid(enhanced_query, top_k=Config.TOP_K_RESULTS)
-            all_results.extend(results_en)
-        
-        # Remove duplicates keeping the best score
-        seen_pages = {}
-        for result in all_results:
-            key = (result['page'], result['text'][:100])  # Use page and first 100 chars as key
-            if key not in seen_pages or result['similarity'] > seen_pages[key]['similarity']:
-                seen_pages[key] = result
-        
-        results = list(seen_pages.values())
-        results.sort(key=lambda x: x['similarity'], reverse=True)
-        results = results[:Config.TOP_K_RESULTS]
+        # Remove duplicates keeping the best score, then keep the top results
+        chunk_ids = np.fromiter((r['chunk_id'] for r in all_results), dtype=np.int64, count=len(all_results))
+        similarities = np.fromiter((r['similarity'] for r in all_results), dtype=np.float64, count=len(all_results))
+        results = [all_results[i] for i in pdf_indexer.dedup_top_k(chunk_ids, similarities, Config.TOP_K_RESULTS)]
         
         if not results:
             return "No relevant information found in the service manual."
         
+        # Look up images/diagrams once per page
+        page_images = {}
+        for result in results:
+            page_num = result['page']
+            if page_num not in page_images:
+                page_images[page_num] = pdf_indexer.get_images_for_page(page_num)
+        
         # Format response with more content
-        response = f"📖 Information found in manual:\n\n"
+        parts = ["📖 Information found in manual:\n\n"]
         
         for i, result in enumerate(results, 1):
             page_num = result['page']
-            response += f"**Result {i} - Page {page_num}**\n"
-            response += f"Relevance: {result['similarity']:.2%}\n"
+            parts.append(f"**Result {i} - Page {page_num}**\n")
+            parts.append(f"Relevance: {result['similarity']:.2%}\n")
             
             # Check if there are images/diagrams on this page
-            images_info = pdf_indexer.get_images_for_page(page_num)
+            images_info = page_images[page_num]
             if images_info:
-                response += f"📷 This page contains {len(images_info)} reference diagram(s)/image(s)\n"
+                parts.append(f"📷 This page contains {len(images_info)} reference diagram(s)/image(s)\n")
             
             # Show more content (up to 1000 characters)
             content = result['text']
             if len(content) > 1000:
                 content = content[:1000] + "..."
-            response += f"Content: {content}\n\n"
+            parts.append(f"Content: {content}\n\n")
         
         # Consolidated summary with image information
-        pages = sorted(set(r["page"] for r in results))
-        pages_with_images = []
-        for page_num in pages:
-            if pdf_indexer.get_images_for_page(page_num):
-                pages_with_images.append(page_num)
+        pages = sorted(page_images)
+        pages_with_images = [page_num for page_num in pages if page_images[page_num]]
         
-        response += f"\n📄 Relevant pages: {', '.join(map(str, pages))}\n"
+        parts.append(f"\n📄 Relevant pages: {', '.join(map(str, pages))}\n")
         if pages_with_images:
-            response += f"📷 Pages with diagrams/images: {', '.join(map(str, pages_with_images))}\n"
-            response += f"\n💡 Note: The mentioned pages contain reference diagrams and images that complement the textual information.\n"
+            parts.append(f"📷 Pages with diagrams/images: {', '.join(map(str, pages_with_images))}\n")
+            parts.append("\n💡 Note: The mentioned pages contain reference diagrams and images that complement the textual information.\n")
         
+        response = "".join(parts)
+        _manual_cache.put(cache_key, response)
+        if query_embedding is not None:
+            _manual_semantic_cache.put(query_embedding, response, key=semantic_key)
         return response
         
     except Exception as e:
         return f"Error searching manual: {str(e)}"
 
 
+def search_manual(query: str) -> str:
+    """
+    Searches for technical information in the vehicle service manual.
+    
+    The manual is in English and has over 7000 pages. Searches exhaustively
+    using terms in English and other languages. Returns page number and complete content.
+    
+    Args:
+        query: Query about the mechanical problem or topic to search in the manual
+        
+    Returns:
+        Formatted response with manual information or message if not found
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(asearch_manual(query))
+    
+    # Called from inside a running event loop (async callers should await
+    # asearch_manual instead): run the fan-out on its own loop in a worker thread
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, asearch_manual(query)).result()
+
+
+def _enhance_internet_query(query: str) -> str:
+    """Adds the configured vehicle to an internet search query."""
+    vehicle_info = Config.get_vehicle_info()
+    return f"{query} {vehicle_info}"
+
+
+async def asearch_internet(query: str) -> str:
+    """
+    Searches for information on the internet using Gemini's integrated Google Search.
+    Use this tool ONLY as a fallback after having tried searching the manual.
+    Useful for general information, recent updates or problems not documented in the manual.
+    
+    This uses Gemini's native search capabilities - no external API keys needed.
+    Only requires GOOGLE_API_KEY which is already configured for the agent.
+    
+    IMPORTANT: When this tool is used, the agent MUST:
+    1. Clearly indicate that internet search was performed
+    2. Translate ALL content to match the user's query language - if results are in English but user asked in Spanish, translate everything to Spanish
+    3. Do NOT include a separate sources section unless the URLs are valid and not broken (404 errors) - URLs from grounding metadata are often invalid (404 errors)
+    
+    Args:
+        query: Query about the mechanical problem to search on the internet (language preserved)
+        
+    Returns:
+        Formatted response with internet results and sources
+    """
+    if internet_searcher is None:
+        return "Error: Internet searcher is not initialized."
+    
+    try:
+        # Add vehicle context to search
+        enhanced_query = _enhance_internet_query(query)
+        
+        # Note: Results may be in different language - agent must translate to user's language
+        return await internet_searcher.asearch(enhanced_query, num_results=5)
+        
+    except Exception as e:
+        return f"Error searching internet: {str(e)}"
+
+
 def search_internet(query: str) -> str:
     """
     Searches for information on the internet using Gemini's integrated Google Search.
@@ -151,26 +292,42 @@ def search_internet(query: str) -> str:
     
     try:
         # Add vehicle context to search
-        vehicle_info = Config.get_vehicle_info()
-        enhanced_query = f"{query} {vehicle_info}"
+        enhanced_query = _enhance_internet_query(query)
         
         # The search() method returns formatted results with sources
         # Note: Results may be in different language - agent must translate to user's language
-        results = internet_searcher.search(enhanced_query, num_results=5)
-        
-        return results
+        return internet_searcher.search(enhanced_query, num_results=5)
         
     except Exception as e:
         return f"Error searching internet: {str(e)}"
 
 
+def _as_adk_tool(func, name: str):
+    """
+    Exposes a coroutine tool to ADK under the given name.
+    ADK names tools after the function, and the instruction refers to them
+    as search_manual/search_internet.
+    """
+    async def tool(query: str) -> str:
+        return await func(query)
+    
+    tool.__name__ = tool.__qualname__ = name
+    tool.__doc__ = func.__doc__
+    return tool
+
+
 # Define tools for ADK
 # ADK expects callable functions directly
 def get_tools():
     """Returns configured tools for the ADK agent."""
     # ADK can use functions directly
     # Functions must have descriptive docstrings for ADK to understand them
-    return [search_manual, search_internet]
+    # The coroutine variants are awaited on ADK's own loop; the sync wrappers
+    # would block it while running each search on a new loop in a thread
+    return [
+        _as_adk_tool(asearch_manual, "search_manual"),
+        _as_adk_tool(asearch_internet, "search_internet")
+    ]
 
 
 # Function mapping for the agent
@@ -178,3 +335,9 @@ TOOL_FUNCTIONS = {
     "search_manual": search_manual,
     "search_internet": search_internet
 }
+
+# Native coroutine variants, awaited directly when called from an event loop
+ASYNC_TOOL_FUNCTIONS = {
+    "search_manual": asearch_manual,
+    "search_internet": asearch_internet
+}
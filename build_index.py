@@ -3,12 +3,8 @@ Script to build the PDF service manual index.
 Use it if you want to index the PDF before running the agent.
 """
 import sys
-from pathlib import Path
-from dotenv import load_dotenv
-
-# Load environment variables
-load_dotenv()
 
+# Importing config loads the .env file
 from config import Config
 from pdf_indexer import PDFIndexer
 
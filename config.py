@@ -3,13 +3,54 @@ Mechanical agent configuration.
 Defines vehicle data and file paths.
 """
 import os
+import re
+from functools import lru_cache
 from pathlib import Path
-from typing import Optional, List
+from types import MappingProxyType
+from typing import Optional, List, Tuple
 from pydantic import BaseModel
 from dotenv import load_dotenv
 
+
+@lru_cache(maxsize=None)
+def load_env() -> bool:
+    """
+    Loads the .env file once per process; later calls are no-ops.
+    
+    To force a re-read (e.g. in tests), call load_dotenv(override=True)
+    explicitly and then Config.reload_env().
+    """
+    return load_dotenv()
+
+
 # Load environment variables automatically when config is imported
-load_dotenv()
+load_env()
+
+# Environment variables read by the configuration
+_ENV_KEYS = (
+    "GOOGLE_API_KEY", "LLM_MODEL",
+    "VEHICLE_MODEL", "VEHICLE_YEAR", "VEHICLE_VIN", "VEHICLE_MANUAL_PDF_PATH",
+    "VEHICLE_AFTERMARKET_MODS", "VECTOR_STORE_PATH",
+    "CHUNK_SIZE", "CHUNK_OVERLAP", "EMBEDDING_MODEL",
+    "TOP_K_RESULTS", "SIMILARITY_THRESHOLD",
+    "QUERY_CACHE_SIZE", "SEMANTIC_CACHE_THRESHOLD", "SEARCH_CACHE_TTL",
+    "SEARCH_CACHE_PERSIST", "SEARCH_ERROR_TTL", "SKIP_INDEX_CHECK",
+    "SEARCH_MAX_TOKENS", "INCLUDE_SOURCES", "INDEX_IVF_MIN_CHUNKS", "INDEX_NPROBE",
+    "EMBEDDING_BATCH_SIZE", "EMBEDDING_BACKEND", "EXPORT_METADATA_JSON",
+    "USE_GPU", "TORCH_THREADS",
+)
+
+
+def _read_env() -> MappingProxyType:
+    """Snapshots the configuration environment variables (read-only)."""
+    return MappingProxyType({key: os.environ.get(key) for key in _ENV_KEYS})
+
+
+# Cached environment values, so lookups don't go through os.environ every time
+_ENV = _read_env()
+
+# Separators accepted in VEHICLE_AFTERMARKET_MODS
+_MODS_SEPARATOR_RE = re.compile(r"[,\n]+")
 
 
 class VehicleConfig(BaseModel):
@@ -17,50 +58,61 @@ class VehicleConfig(BaseModel):
     model: str
     year: int
     vin: str
-    manual_pdf_path: str = os.getenv("VEHICLE_MANUAL_PDF_PATH", "service_manual.pdf")
+    manual_pdf_path: str = _ENV.get("VEHICLE_MANUAL_PDF_PATH") or "service_manual.pdf"
     
     def __str__(self) -> str:
         return f"{self.model} {self.year} (VIN: {self.vin})"
 
 
-class ManualPdfPathDescriptor:
-    """Descriptor for MANUAL_PDF_PATH that calculates dynamically."""
-    def __get__(self, obj, objtype=None):
-        if objtype is None:
-            objtype = type(obj)
-        
-        # If vehicle is configured, use its manual_pdf_path
-        if objtype.vehicle and objtype.vehicle.manual_pdf_path:
-            manual_path = objtype.vehicle.manual_pdf_path
-            # If it's a relative path, make it relative to BASE_DIR
-            if not Path(manual_path).is_absolute():
-                return objtype.BASE_DIR / manual_path
-            return Path(manual_path)
-        
-        # Otherwise, use .env or default
-        default_path = os.getenv("VEHICLE_MANUAL_PDF_PATH", "service_manual.pdf")
-        return objtype.BASE_DIR / default_path
+def _resolve_manual_pdf_path(vehicle: Optional[VehicleConfig], base_dir: Path) -> Path:
+    """Resolves the service manual path for a vehicle (or the .env/default path)."""
+    # If vehicle is configured, use its manual_pdf_path
+    if vehicle and vehicle.manual_pdf_path:
+        manual_path = Path(vehicle.manual_pdf_path)
+        # If it's a relative path, make it relative to BASE_DIR
+        if not manual_path.is_absolute():
+            return base_dir / manual_path
+        return manual_path
+    
+    # Otherwise, use .env or default
+    default_path = _ENV.get("VEHICLE_MANUAL_PDF_PATH") or "service_manual.pdf"
+    return base_dir / default_path
 
 
 class Config:
     """Global agent configuration."""
     
     # API Keys
-    GOOGLE_API_KEY: str = os.getenv("GOOGLE_API_KEY", "")
+    GOOGLE_API_KEY: str = _ENV.get("GOOGLE_API_KEY") or ""
     
     # LLM Model configuration (configurable via .env)
-    LLM_MODEL: str = os.getenv("LLM_MODEL", "gemini-2.5-flash")
+    LLM_MODEL: str = _ENV.get("LLM_MODEL") or "gemini-2.5-flash"
     
     # Vehicle configuration (loaded from .env or can be configured manually)
     vehicle: Optional[VehicleConfig] = None
+    # Cached get_vehicle_info() string, with the (model, year, vin) it was built from,
+    # so assigning Config.vehicle (or its fields) directly doesn't leave it stale
+    _vehicle_info: Optional[Tuple[tuple, str]] = None
+    
+    @classmethod
+    def reload_env(cls):
+        """
+        Re-reads the cached environment variables (e.g. after calling load_dotenv()
+        again, or in tests). Settings evaluated at import time, like CHUNK_SIZE,
+        are not recomputed.
+        """
+        global _ENV
+        _ENV = _read_env()
+        cls.invalidate_path_cache()
+        return _ENV
     
     @classmethod
     def load_vehicle_from_env(cls):
         """Loads vehicle configuration from environment variables."""
-        model = os.getenv("VEHICLE_MODEL", "")
-        year_str = os.getenv("VEHICLE_YEAR", "")
-        vin = os.getenv("VEHICLE_VIN", "")
-        manual_pdf_path = os.getenv("VEHICLE_MANUAL_PDF_PATH", None)
+        model = _ENV.get("VEHICLE_MODEL") or ""
+        year_str = _ENV.get("VEHICLE_YEAR") or ""
+        vin = _ENV.get("VEHICLE_VIN") or ""
+        manual_pdf_path = _ENV.get("VEHICLE_MANUAL_PDF_PATH")
         
         if model and year_str and vin:
             try:
@@ -78,57 +130,78 @@ class Config:
     
     # Paths
     BASE_DIR: Path = Path(__file__).parent
-    MANUAL_PDF_PATH = ManualPdfPathDescriptor()  # Dynamic path based on vehicle or .env
-    VECTOR_STORE_PATH: Path = BASE_DIR / os.getenv("VECTOR_STORE_PATH", "vector_store")
-    INDEX_PATH: Path = None  # Will be set dynamically
-    METADATA_PATH: Path = None  # Will be set dynamically
-    IMAGES_PATH: Path = None  # Will be set dynamically
-    IMAGES_METADATA_PATH: Path = None  # Will be set dynamically
-    
-    @classmethod
-    def _init_paths(cls):
-        """Initialize paths that depend on VECTOR_STORE_PATH."""
-        if cls.INDEX_PATH is None:
-            cls.INDEX_PATH = cls.VECTOR_STORE_PATH / "faiss_index"
-            cls.METADATA_PATH = cls.VECTOR_STORE_PATH / "metadata.json"
-            cls.IMAGES_PATH = cls.VECTOR_STORE_PATH / "images"
-            cls.IMAGES_METADATA_PATH = cls.VECTOR_STORE_PATH / "images_metadata.json"
+    # Based on the vehicle or .env; resolved once and refreshed when the vehicle changes
+    MANUAL_PDF_PATH: Path = _resolve_manual_pdf_path(None, BASE_DIR)
+    VECTOR_STORE_PATH: Path = BASE_DIR / (_ENV.get("VECTOR_STORE_PATH") or "vector_store")
+    INDEX_PATH: Path = VECTOR_STORE_PATH / "faiss_index"
+    METADATA_PATH: Path = VECTOR_STORE_PATH / "metadata.npz"
+    LEGACY_METADATA_PATH: Path = VECTOR_STORE_PATH / "metadata.json"  # Chunk metadata of older indexes (still loaded)
+    IMAGES_PATH: Path = VECTOR_STORE_PATH / "images"
+    IMAGES_METADATA_PATH: Path = VECTOR_STORE_PATH / "images_metadata.pkl"
+    KEYWORD_INDEX_PATH: Path = VECTOR_STORE_PATH / "keyword_index.pkl"
+    LEGACY_IMAGES_METADATA_PATH: Path = VECTOR_STORE_PATH / "images_metadata.json"  # Image metadata of older indexes (still loaded)
+    EXPORT_METADATA_JSON: bool = (_ENV.get("EXPORT_METADATA_JSON") or "").lower() in ("1", "true", "yes")  # Also write JSON copies of the metadata
+    INDEX_READY_PATH: Path = VECTOR_STORE_PATH / ".ready"  # Marker written once the index is fully saved
+    SKIP_INDEX_CHECK: bool = (_ENV.get("SKIP_INDEX_CHECK") or "").lower() in ("1", "true", "yes")  # Assume the index is built (main.py)
     
     # Indexing configuration (configurable via .env)
-    CHUNK_SIZE: int = int(os.getenv("CHUNK_SIZE", "1000"))  # Characters per chunk
-    CHUNK_OVERLAP: int = int(os.getenv("CHUNK_OVERLAP", "200"))  # Overlap between chunks
-    EMBEDDING_MODEL: str = os.getenv(
-        "EMBEDDING_MODEL", 
-        "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+    CHUNK_SIZE: int = int(_ENV.get("CHUNK_SIZE") or "1000")  # Characters per chunk
+    CHUNK_OVERLAP: int = int(_ENV.get("CHUNK_OVERLAP") or "200")  # Overlap between chunks
+    EMBEDDING_MODEL: str = (
+        _ENV.get("EMBEDDING_MODEL")
+        or "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
     )
+    EMBEDDING_BACKEND: str = (_ENV.get("EMBEDDING_BACKEND") or "torch").lower()  # "torch" or "onnx" (int8 quantized)
+    EMBEDDING_BATCH_SIZE: int = int(_ENV.get("EMBEDDING_BATCH_SIZE") or "64")  # Chunks per encode batch (raise on GPU)
+    USE_GPU: bool = (_ENV.get("USE_GPU") or "true").lower() in ("1", "true", "yes")  # Use a GPU for embeddings/search when available
+    TORCH_THREADS: int = int(_ENV.get("TORCH_THREADS") or "0")  # PyTorch CPU threads for encoding (0 = available CPUs - 1)
+    INDEX_IVF_MIN_CHUNKS: int = int(_ENV.get("INDEX_IVF_MIN_CHUNKS") or "10000")  # Chunks from which an IVF-PQ index is built
+    INDEX_NPROBE: int = int(_ENV.get("INDEX_NPROBE") or "8")  # IVF clusters scanned per search
     
     # Search configuration (configurable via .env)
-    TOP_K_RESULTS: int = int(os.getenv("TOP_K_RESULTS", "10"))  # Number of results to return
-    SIMILARITY_THRESHOLD: float = float(os.getenv("SIMILARITY_THRESHOLD", "0.5"))  # Minimum similarity threshold
+    TOP_K_RESULTS: int = int(_ENV.get("TOP_K_RESULTS") or "10")  # Number of results to return
+    SIMILARITY_THRESHOLD: float = float(_ENV.get("SIMILARITY_THRESHOLD") or "0.5")  # Minimum similarity threshold
+    
+    # Tool response cache configuration (configurable via .env)
+    QUERY_CACHE_SIZE: int = int(_ENV.get("QUERY_CACHE_SIZE") or "256")  # Cached responses per tool (0 disables)
+    SEMANTIC_CACHE_THRESHOLD: float = float(_ENV.get("SEMANTIC_CACHE_THRESHOLD") or "0.92")  # Similarity for near-duplicate hits
+    SEARCH_CACHE_TTL: float = float(_ENV.get("SEARCH_CACHE_TTL") or "1800")  # Seconds internet results stay cached (0 = no expiry)
+    SEARCH_CACHE_PERSIST: bool = (_ENV.get("SEARCH_CACHE_PERSIST") or "true").lower() in ("1", "true", "yes")  # Keep internet results on disk across runs
+    SEARCH_CACHE_PATH: Path = VECTOR_STORE_PATH / "search_cache.sqlite3"
+    SEARCH_ERROR_TTL: float = float(_ENV.get("SEARCH_ERROR_TTL") or "10")  # Seconds a failed search is remembered (0 disables)
     
     # Internet search now uses Gemini's integrated Google Search
     # No external API keys needed - only GOOGLE_API_KEY is required
+    SEARCH_MAX_TOKENS: int = int(_ENV.get("SEARCH_MAX_TOKENS") or "1024")  # Output token cap for internet search answers
+    INCLUDE_SOURCES: bool = (_ENV.get("INCLUDE_SOURCES") or "").lower() in ("1", "true", "yes")  # Append source URLs to search results
     
     # Aftermarket modifications (optional)
     # List of aftermarket modifications installed on the vehicle
     # Can be loaded from .env as VEHICLE_AFTERMARKET_MODS (comma-separated or newline-separated)
     aftermarket_modifications: List[str] = []
+    _mods_tuple: Tuple[str, ...] = ()  # Immutable snapshot returned by get_aftermarket_modifications()
+    _mods_info_cache: Optional[str] = None  # Cached get_aftermarket_mods_info() string
+    
+    @classmethod
+    def _mods_changed(cls):
+        """Refreshes the cached views of aftermarket_modifications after it changes."""
+        cls._mods_tuple = tuple(cls.aftermarket_modifications)
+        cls._mods_info_cache = None
     
     @classmethod
     def load_aftermarket_mods_from_env(cls):
         """Loads aftermarket modifications from environment variable."""
-        mods_str = os.getenv("VEHICLE_AFTERMARKET_MODS", "").strip()
+        mods_str = (_ENV.get("VEHICLE_AFTERMARKET_MODS") or "").strip()
         if not mods_str:
             cls.aftermarket_modifications = []
+            cls._mods_changed()
             return []
         
-        # Support both comma-separated and newline-separated formats
-        if "\n" in mods_str:
-            mods = [mod.strip() for mod in mods_str.split("\n") if mod.strip()]
-        else:
-            mods = [mod.strip() for mod in mods_str.split(",") if mod.strip()]
+        # Support both comma-separated and newline-separated formats (single pass)
+        mods = [mod for mod in (part.strip() for part in _MODS_SEPARATOR_RE.split(mods_str)) if mod]
         
         cls.aftermarket_modifications = mods
+        cls._mods_changed()
         return mods
     
     @classmethod
@@ -140,6 +213,7 @@ class Config:
             modifications: List of modification names/descriptions
         """
         cls.aftermarket_modifications = [mod.strip() for mod in modifications if mod.strip()]
+        cls._mods_changed()
         return cls.aftermarket_modifications
     
     @classmethod
@@ -153,19 +227,23 @@ class Config:
         mod = modification.strip()
         if mod and mod not in cls.aftermarket_modifications:
             cls.aftermarket_modifications.append(mod)
+            cls._mods_changed()
         return cls.aftermarket_modifications
     
     @classmethod
-    def get_aftermarket_modifications(cls) -> List[str]:
-        """Returns the list of aftermarket modifications."""
-        return cls.aftermarket_modifications.copy()
+    def get_aftermarket_modifications(cls) -> Tuple[str, ...]:
+        """
+        Returns the aftermarket modifications as an immutable tuple (shared, not copied).
+        Use list(Config.get_aftermarket_modifications()) if a mutable list is needed.
+        """
+        return cls._mods_tuple
     
     @classmethod
     def set_vehicle(cls, model: str, year: int, vin: str, manual_pdf_path: Optional[str] = None):
         """Configures vehicle data."""
         # Use provided path, .env value, or default
         if manual_pdf_path is None:
-            manual_pdf_path = os.getenv("VEHICLE_MANUAL_PDF_PATH", "service_manual.pdf")
+            manual_pdf_path = _ENV.get("VEHICLE_MANUAL_PDF_PATH") or "service_manual.pdf"
         
         cls.vehicle = VehicleConfig(
             model=model,
@@ -173,14 +251,27 @@ class Config:
             vin=vin,
             manual_pdf_path=manual_pdf_path
         )
+        cls.invalidate_path_cache()
         return cls.vehicle
     
+    @classmethod
+    def invalidate_path_cache(cls):
+        """
+        Resolves MANUAL_PDF_PATH again for the current vehicle.
+        Called by set_vehicle(); call it after assigning Config.vehicle directly.
+        """
+        cls.MANUAL_PDF_PATH = _resolve_manual_pdf_path(cls.vehicle, cls.BASE_DIR)
+    
     @classmethod
     def get_vehicle_info(cls) -> str:
         """Returns vehicle information as a string."""
-        if cls.vehicle is None:
+        vehicle = cls.vehicle
+        if vehicle is None:
             return "Vehicle not configured"
-        return f"Vehicle: {cls.vehicle.model} {cls.vehicle.year}, VIN: {cls.vehicle.vin}"
+        key = (vehicle.model, vehicle.year, vehicle.vin)
+        if cls._vehicle_info is None or cls._vehicle_info[0] != key:
+            cls._vehicle_info = (key, f"Vehicle: {vehicle.model} {vehicle.year}, VIN: {vehicle.vin}")
+        return cls._vehicle_info[1]
     
     @classmethod
     def get_aftermarket_mods_info(cls) -> str:
@@ -188,12 +279,12 @@ class Config:
         Returns aftermarket modifications information as a formatted string.
         Returns empty string if no modifications are configured.
         """
-        if not cls.aftermarket_modifications:
-            return ""
-        
-        mods_list = "\n".join(f"  - {mod}" for mod in cls.aftermarket_modifications)
-        return f"\nAFTERMARKET MODIFICATIONS:\n{mods_list}"
-
+        # Cached until the modifications change through one of the setters
+        if cls._mods_info_cache is None:
+            if cls.aftermarket_modifications:
+                mods_list = "\n".join(f"  - {mod}" for mod in cls.aftermarket_modifications)
+                cls._mods_info_cache = f"\nAFTERMARKET MODIFICATIONS:\n{mods_list}"
+            else:
+                cls._mods_info_cache = ""
+        return cls._mods_info_cache
 
-# Initialize paths on module load
-Config._init_paths()
@@ -2,30 +2,214 @@
 Internet search using Gemini's integrated Google Search.
 No external API keys required - uses Gemini's native search capabilities.
 """
-import os
-from typing import Optional
-from google.genai import Client, types
+import asyncio
+import threading
+from concurrent.futures import Future
+from functools import lru_cache
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, Optional, Tuple
 
 from config import Config
+from query_cache import QueryCache, SQLiteQueryCache, normalize_query
 import re
+import sqlite3
 from urllib.parse import urlparse
 
+if TYPE_CHECKING:
+    from google.genai import Client
+
+
+# URLs mentioned in the response text. The last character can't be trailing
+# punctuation, so sentence ends and Markdown link wrappers are not captured
+_URL_RE = re.compile(r'https?://[^\s<>"\'\)\]]*[^\s<>"\'\)\].,;:!?]')
+
+# Source URL filters, compiled once instead of scanning lists on every URL:
+# search engine pages (matched against domain + path; engine names only in
+# the domain part), local hosts/IP addresses, query parameters and the
+# sites allowed to use them
+_SEARCH_PAGE_RE = re.compile(
+    r'^[^/]*(?:google\.|duckduckgo\.com|search\.yahoo\.com)|youtube\.com/results|bing\.com/search'
+)
+_LOCAL_HOST_RE = re.compile(r'localhost|[\d.:]+$')
+_QUERY_PARAM_RE = re.compile(r'search_query=|q=|query=')
+_QUERY_PARAM_SITES_RE = re.compile(r'reddit\.com|stackoverflow\.com')
+
+# "### A1:" style headers separating the answers of a batched search
+_BATCH_ANSWER_RE = re.compile(r'^\s*#{2,4}\s*A(\d+)\s*:?', re.MULTILINE)
+
+# Models accepting thinking_budget=0 (older models reject thinking_config,
+# "pro" models can't turn thinking off)
+_NO_THINKING_MODEL_RE = re.compile(r'gemini-2\.5-flash')
+
+# Transient HTTP statuses retried by the Gemini client
+_RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# Dict-based request options for google-genai versions without typed tools
+_LEGACY_TOOLS = [{"google_search": {}}]
+_LEGACY_CONFIG = {"temperature": 0.7, "max_output_tokens": Config.SEARCH_MAX_TOKENS}
+_LEGACY_GROUNDED_CONFIG = {**_LEGACY_CONFIG, "tools": _LEGACY_TOOLS}
+
+
+@lru_cache(maxsize=1)
+def _get_client(api_key: str) -> "Client":
+    """
+    Returns the process-wide Gemini client for an API key.
+    
+    The client keeps its HTTP connection pool, so sharing it lets searchers
+    created later (e.g. by setup_tools(force=True)) reuse open connections
+    instead of paying a new TCP + TLS handshake.
+    """
+    # google-genai (and its grpc/auth/httpx dependencies) is only imported
+    # once a searcher is actually configured
+    from google.genai import Client, types
+    
+    # Retry transient errors inside the client, over its pooled connections,
+    # instead of failing the tool call and paying for a new request
+    try:
+        http_options = types.HttpOptions(
+            retry_options=types.HttpRetryOptions(
+                attempts=3,
+                initial_delay=0.2,
+                http_status_codes=list(_RETRY_STATUS_CODES)
+            )
+        )
+    except (AttributeError, TypeError, ValueError):
+        # Older google-genai versions without built-in retry options
+        return Client(api_key=api_key)
+    
+    return Client(api_key=api_key, http_options=http_options)
+
+
+@lru_cache(maxsize=1)
+def _get_disk_cache() -> Optional[SQLiteQueryCache]:
+    """Returns the process-wide persistent search cache, or None if it can't be opened."""
+    try:
+        return SQLiteQueryCache(Config.SEARCH_CACHE_PATH, ttl=Config.SEARCH_CACHE_TTL)
+    except (OSError, sqlite3.Error) as e:
+        print(f"⚠️ Warning: Could not open search cache at {Config.SEARCH_CACHE_PATH}: {e}")
+        return None
+
 
 class InternetSearch:
     """Internet searcher using Gemini's integrated Google Search."""
     
     def __init__(self):
         """Initializes the Gemini client for integrated search."""
+        # Formatted responses keyed by (normalized query, num_results)
+        self._cache = QueryCache(maxsize=Config.QUERY_CACHE_SIZE, ttl=Config.SEARCH_CACHE_TTL)
+        # Same results on disk, so separate runs (e.g. single-query CLI calls) hit too
+        self._disk_cache = _get_disk_cache() if Config.SEARCH_CACHE_PERSIST else None
+        # Failed searches, kept briefly so a persistent failure isn't retried on every call
+        self._error_cache = QueryCache(
+            maxsize=Config.QUERY_CACHE_SIZE if Config.SEARCH_ERROR_TTL > 0 else 0,
+            ttl=Config.SEARCH_ERROR_TTL
+        )
+        # Results of queries currently being searched, shared with identical concurrent queries
+        self._inflight: Dict[tuple, Future] = {}
+        self._inflight_lock = threading.Lock()
+        
         if not Config.GOOGLE_API_KEY:
             self.client = None
             return
         
-        os.environ["GOOGLE_API_KEY"] = Config.GOOGLE_API_KEY
+        # The key is passed explicitly to the client, so the environment is left untouched
         try:
-            self.client = Client(api_key=Config.GOOGLE_API_KEY)
+            self.client = _get_client(Config.GOOGLE_API_KEY)
         except Exception as e:
             print(f"⚠️ Warning: Could not initialize Gemini client for search: {e}")
             self.client = None
+            return
+        
+        # Detect the supported API format once instead of on every query
+        self._search_config = None
+        self._invoke = self._select_invoker()
+    
+    def _select_invoker(self):
+        """
+        Picks how to call generate_content with Google Search for the installed
+        google-genai version.
+        
+        Returns:
+            Callable taking the prompt and returning the Gemini response
+        """
+        from google.genai import types
+        
+        # Format 1: Using types.Tool with GoogleSearch
+        # (the config is immutable per searcher, so it is built once and reused)
+        try:
+            config_kwargs = dict(
+                tools=[types.Tool(google_search=types.GoogleSearch())],
+                temperature=0.7,
+                max_output_tokens=Config.SEARCH_MAX_TOKENS,
+                candidate_count=1
+            )
+        except (AttributeError, TypeError, ValueError):
+            config_kwargs = None
+        
+        # Search summaries don't need internal reasoning (only sent to models that accept it)
+        if config_kwargs is not None and _NO_THINKING_MODEL_RE.search(Config.LLM_MODEL):
+            try:
+                config_kwargs["thinking_config"] = types.ThinkingConfig(thinking_budget=0)
+            except (AttributeError, TypeError, ValueError):
+                pass
+        
+        try:
+            self._search_config = types.GenerateContentConfig(**config_kwargs) if config_kwargs else None
+        except (AttributeError, TypeError, ValueError):
+            self._search_config = None
+        
+        if self._search_config is not None:
+            return lambda prompt: self.client.models.generate_content(
+                model=Config.LLM_MODEL,
+                contents=prompt,
+                config=self._search_config
+            )
+        
+        # Typed tools not available: use the dict-based formats
+        return self._generate_content_legacy
+    
+    def _generate_content_legacy(self, prompt: str):
+        """
+        Calls generate_content using dict-based formats (older google-genai versions).
+        The first format that works is remembered and called directly afterwards.
+        """
+        # Only errors meaning "format not supported" move on to the next format;
+        # anything else (e.g. network errors) propagates without being remembered
+        for call in (self._generate_content_dict_tools, self._generate_content_dict_config):
+            try:
+                response = call(prompt)
+            except (AttributeError, TypeError, ValueError):
+                continue
+            self._invoke = call
+            return response
+        
+        response = self._generate_content_plain(prompt)
+        self._invoke = self._generate_content_plain
+        return response
+    
+    def _generate_content_dict_tools(self, prompt: str):
+        # Format 2: Using dict format for tools
+        return self.client.models.generate_content(
+            model=Config.LLM_MODEL,
+            contents=prompt,
+            tools=_LEGACY_TOOLS,
+            config=_LEGACY_CONFIG
+        )
+    
+    def _generate_content_dict_config(self, prompt: str):
+        # Format 3: Using config with grounding parameter
+        return self.client.models.generate_content(
+            model=Config.LLM_MODEL,
+            contents=prompt,
+            config=_LEGACY_GROUNDED_CONFIG
+        )
+    
+    def _generate_content_plain(self, prompt: str):
+        # Format 4: Simple call - Gemini may have search enabled by default
+        return self.client.models.generate_content(
+            model=Config.LLM_MODEL,
+            contents=prompt,
+            config=_LEGACY_CONFIG
+        )
     
     def _is_valid_source_url(self, url: str) -> bool:
         """
@@ -46,41 +230,25 @@ class InternetSearch:
         if not url.startswith(('http://', 'https://')):
             return False
         
+        # Filter out very short URLs (likely incomplete)
+        if len(url) < 15:
+            return False
+        
         try:
             parsed = urlparse(url)
             domain = parsed.netloc.lower()
             
-            # Filter out search engine result pages
-            search_domains = [
-                'google.com',
-                'google.co',
-                'google.',
-                'youtube.com/results',
-                'bing.com/search',
-                'duckduckgo.com',
-                'search.yahoo.com',
-            ]
-            
-            for search_domain in search_domains:
-                if search_domain in domain or domain.endswith(search_domain):
-                    return False
-            
-            # Filter out URLs that are clearly search queries
-            if 'search_query=' in url or 'q=' in url or 'query=' in url:
-                # But allow specific sites that might use these params legitimately
-                if 'reddit.com' not in domain and 'stackoverflow.com' not in domain:
-                    return False
-            
-            # Filter out very short URLs (likely incomplete)
-            if len(url) < 15:
+            # Must have a valid domain, other than localhost or an IP address
+            if '.' not in domain or _LOCAL_HOST_RE.match(domain):
                 return False
             
-            # Must have a valid domain
-            if not domain or '.' not in domain:
+            # Filter out search engine result pages
+            if _SEARCH_PAGE_RE.search(domain + parsed.path):
                 return False
             
-            # Filter out localhost and IP addresses
-            if domain.startswith('localhost') or domain.replace('.', '').replace(':', '').isdigit():
+            # Filter out URLs that are clearly search queries
+            # But allow specific sites that might use these params legitimately
+            if _QUERY_PARAM_RE.search(url) and not _QUERY_PARAM_SITES_RE.search(domain):
                 return False
             
             return True
@@ -88,20 +256,75 @@ class InternetSearch:
         except Exception:
             return False
     
-    def _extract_valid_urls(self, sources: list) -> list:
+    @staticmethod
+    def _extract_text(response) -> str:
         """
-        Filters and validates URLs, removing invalid ones.
+        Returns the answer text of a Gemini response.
+        google-genai >= 0.3 joins the text parts of the first candidate into
+        response.text, so the candidates are not walked here.
         
         Args:
-            sources: List of URLs to filter
+            response: Gemini response
+            
+        Returns:
+            Response text, or an empty string if there is none
+        """
+        return getattr(response, 'text', None) or ""
+    
+    def _iter_source_urls(self, responses: List, result_text: str) -> Iterator[str]:
+        """
+        Yields candidate source URLs from a response, most reliable first.
+        
+        Args:
+            responses: Gemini response (or the chunks of a streamed response)
+            result_text: Text extracted from the response
+            
+        Yields:
+            URLs from grounding metadata, then URLs mentioned in the text
+        """
+        # Try to get grounding metadata with citations
+        found_grounding = False
+        for response in responses:
+            for uri in self._grounding_uris(getattr(response, 'grounding_metadata', None)):
+                found_grounding = True
+                yield uri
+        
+        # Alternative: check candidates for citations (they usually repeat the
+        # top-level metadata, so only when that had none)
+        if not found_grounding:
+            for response in responses:
+                for candidate in getattr(response, 'candidates', None) or ():
+                    yield from self._grounding_uris(getattr(candidate, 'grounding_metadata', None))
+        
+        # Also try to extract URLs from the response text (but be selective)
+        for match in _URL_RE.finditer(result_text):
+            yield match.group()
+    
+    @staticmethod
+    def _grounding_uris(grounding_metadata) -> Iterator[str]:
+        """Yields the web URIs cited in a grounding metadata object (if any)."""
+        for chunk in getattr(grounding_metadata, 'grounding_chunks', None) or ():
+            uri = getattr(getattr(chunk, 'web', None), 'uri', None)
+            if uri:
+                yield uri
+    
+    def _extract_valid_urls(self, sources: Iterable[str], limit: Optional[int] = None) -> list:
+        """
+        Filters and validates URLs, removing invalid ones and duplicates.
+        
+        Args:
+            sources: URLs to filter (consumed only until limit valid URLs are found)
+            limit: Maximum number of URLs to return (None for all)
             
         Returns:
             List of valid URLs
         """
-        valid_urls = []
-        seen_domains = set()
+        valid_urls = {}  # Insertion-ordered set
         
         for url in sources:
+            if limit is not None and len(valid_urls) >= limit:
+                break
+            
             if not url:
                 continue
             
@@ -111,18 +334,10 @@ class InternetSearch:
             if not self._is_valid_source_url(url):
                 continue
             
-            # Avoid duplicates by domain
-            try:
-                parsed = urlparse(url)
-                domain = parsed.netloc.lower()
-                
-                # Allow multiple URLs from same domain if they're different paths
-                if url not in valid_urls:
-                    valid_urls.append(url)
-            except Exception:
-                continue
+            # Allow multiple URLs from same domain if they're different paths
+            valid_urls.setdefault(url, None)
         
-        return valid_urls
+        return list(valid_urls)
     
     def search(self, query: str, num_results: int = 5) -> str:
         """
@@ -139,133 +354,348 @@ class InternetSearch:
         if not self.client:
             return "Error: GOOGLE_API_KEY not configured. Internet search requires Google API key."
         
+        cache_key = (normalize_query(query), num_results)
+        cached = self._cached_result(cache_key)
+        if cached is not None:
+            return cached
+        
+        # Identical queries already in progress are waited for, not sent again
+        flight, is_leader = self._join_flight(cache_key)
+        if not is_leader:
+            return flight.result()
+        
+        result = None
         try:
-            # Use Gemini with Google Search grounding (integrated search)
-            # This enables Google Search directly in the model
-            # The query language is preserved - results will be returned and should be translated by the agent
-            search_prompt = (
-                f"Search the internet for information about: {query}. "
-                "Provide a detailed, comprehensive answer with specific facts, data, and sources. "
-                "Include relevant URLs and citations where applicable. "
-                "Provide the response in the same language as the query if possible."
-            )
-            
-            response = None
-            
-            # Try different API formats for Google Search integration
-            # Format 1: Using types.Tool with GoogleSearch
-            try:
-                response = self.client.models.generate_content(
-                    model=Config.LLM_MODEL,
-                    contents=search_prompt,
-                    config=types.GenerateContentConfig(
-                        tools=[types.Tool(google_search=types.GoogleSearch())],
-                        temperature=0.7
-                    )
-                )
-            except (AttributeError, TypeError, ValueError) as e1:
-                # Format 2: Using dict format for tools
-                try:
-                    response = self.client.models.generate_content(
-                        model=Config.LLM_MODEL,
-                        contents=search_prompt,
-                        tools=[{"google_search": {}}],
-                        config={"temperature": 0.7}
-                    )
-                except (AttributeError, TypeError, ValueError) as e2:
-                    # Format 3: Using config with grounding parameter
-                    try:
-                        response = self.client.models.generate_content(
-                            model=Config.LLM_MODEL,
-                            contents=search_prompt,
-                            config={
-                                "temperature": 0.7,
-                                "tools": [{"google_search": {}}]
-                            }
-                        )
-                    except Exception as e3:
-                        # Format 4: Simple call - Gemini may have search enabled by default
-                        try:
-                            response = self.client.models.generate_content(
-                                model=Config.LLM_MODEL,
-                                contents=search_prompt,
-                                config={"temperature": 0.7}
-                            )
-                        except Exception as e4:
-                            return f"Error: Could not perform search. Tried multiple API formats. Last error: {str(e4)}"
-            
-            if not response:
-                return "Error: No response received from search."
+            response = self._invoke(self._build_prompt(query))
+            result = self._format_response(response, num_results)
+        except Exception as e:
+            result = f"Error searching internet: {str(e)}"
+        finally:
+            # Interrupted (e.g. cancelled): don't leave the waiting callers hanging
+            if result is None:
+                self._abandon_flight(cache_key, flight)
+        return self._finish_flight(cache_key, flight, result)
+    
+    async def asearch(self, query: str, num_results: int = 5) -> str:
+        """
+        Async variant of search() that does not block the event loop.
+        Independent queries can run concurrently with asyncio.gather.
+        
+        Args:
+            query: Search query
+            num_results: Number of results to return (for formatting)
             
-            # Extract text from response
-            result_text = ""
-            if hasattr(response, 'text'):
-                result_text = response.text
-            elif hasattr(response, 'candidates') and response.candidates:
-                if hasattr(response.candidates[0], 'content'):
-                    content = response.candidates[0].content
-                    if hasattr(content, 'parts'):
-                        for part in content.parts:
-                            if hasattr(part, 'text'):
-                                result_text += part.text
-                    elif hasattr(content, 'text'):
-                        result_text = content.text
+        Returns:
+            Formatted search results as a string
+        """
+        if not self.client:
+            return "Error: GOOGLE_API_KEY not configured. Internet search requires Google API key."
+        
+        cache_key = (normalize_query(query), num_results)
+        cached = self._cached_result(cache_key)
+        if cached is not None:
+            return cached
+        
+        # Identical queries already in progress are waited for, not sent again
+        flight, is_leader = self._join_flight(cache_key)
+        if not is_leader:
+            return await asyncio.wrap_future(flight)
+        
+        result = None
+        try:
+            response = await self._ainvoke(self._build_prompt(query))
+            result = self._format_response(response, num_results)
+        except Exception as e:
+            result = f"Error searching internet: {str(e)}"
+        finally:
+            # Interrupted (e.g. cancelled): don't leave the waiting callers hanging
+            if result is None:
+                self._abandon_flight(cache_key, flight)
+        return self._finish_flight(cache_key, flight, result)
+    
+    def search_stream(self, query: str, num_results: int = 5) -> Iterator[str]:
+        """
+        Streaming variant of search(): yields the answer text as Gemini produces it,
+        so consumers can start working before the full response has arrived.
+        
+        Args:
+            query: Search query
+            num_results: Number of results to return (for formatting)
             
-            if not result_text:
-                return "No results found on the internet."
+        Yields:
+            Chunks of the formatted search results
+        """
+        if not self.client:
+            yield "Error: GOOGLE_API_KEY not configured. Internet search requires Google API key."
+            return
+        
+        cache_key = (normalize_query(query), num_results)
+        cached = self._cached_result(cache_key)
+        if cached is not None:
+            yield cached
+            return
+        
+        generate_stream = getattr(self.client.models, 'generate_content_stream', None)
+        if self._search_config is None or generate_stream is None:
+            # Streaming not available for this format/version
+            yield self.search(query, num_results=num_results)
+            return
+        
+        pieces = []
+        chunks = []  # Kept for their grounding metadata (sources section)
+        try:
+            for chunk in generate_stream(
+                model=Config.LLM_MODEL,
+                contents=self._build_prompt(query),
+                config=self._search_config
+            ):
+                chunks.append(chunk)
+                text = self._extract_text(chunk)
+                if text:
+                    pieces.append(text)
+                    yield text
+        except Exception as e:
+            yield f"Error searching internet: {str(e)}"
+            return
+        
+        if not pieces:
+            yield "No results found on the internet."
+            return
+        
+        # Same result search() would produce, so either can serve the cached entry
+        result_text = "".join(pieces)
+        sources = self._format_sources(chunks, result_text, num_results)
+        if sources:
+            yield sources
+        self._cache_result(cache_key, result_text + sources)
+    
+    def search_batch(self, queries: List[str], num_results: int = 5) -> List[str]:
+        """
+        Answers several related queries with a single grounded Gemini request.
+        Falls back to one search() per query if the combined answer can't be
+        split back into one section per query, or when INCLUDE_SOURCES is on
+        (the sources of a combined answer can't be attributed to each query).
+        
+        Args:
+            queries: Search queries
+            num_results: Number of results to return per query (for formatting)
             
-            # Try to extract source citations if available
-            all_sources = []
+        Returns:
+            Formatted results, in the same order as the queries
+        """
+        if not self.client:
+            return ["Error: GOOGLE_API_KEY not configured. Internet search requires Google API key."] * len(queries)
+        
+        results: List[Optional[str]] = [
+            self._cached_result((normalize_query(query), num_results)) for query in queries
+        ]
+        pending = [i for i, result in enumerate(results) if result is None]
+        if len(pending) > 1 and not Config.INCLUDE_SOURCES:
             try:
-                # Try to get grounding metadata with citations
-                if hasattr(response, 'grounding_metadata') and response.grounding_metadata:
-                    if hasattr(response.grounding_metadata, 'grounding_chunks'):
-                        for chunk in response.grounding_metadata.grounding_chunks:
-                            if hasattr(chunk, 'web') and hasattr(chunk.web, 'uri'):
-                                uri = chunk.web.uri
-                                if uri:
-                                    all_sources.append(uri)
-                
-                # Alternative: check candidates for citations
-                if hasattr(response, 'candidates') and response.candidates:
-                    for candidate in response.candidates:
-                        if hasattr(candidate, 'grounding_metadata') and candidate.grounding_metadata:
-                            if hasattr(candidate.grounding_metadata, 'grounding_chunks'):
-                                for chunk in candidate.grounding_metadata.grounding_chunks:
-                                    if hasattr(chunk, 'web') and hasattr(chunk.web, 'uri'):
-                                        uri = chunk.web.uri
-                                        if uri:
-                                            all_sources.append(uri)
-                
-                # Also try to extract URLs from the response text (but be selective)
-                url_pattern = r'https?://[^\s\)]+'
-                text_urls = re.findall(url_pattern, result_text)
-                for url in text_urls:
-                    # Clean up URL (remove trailing punctuation that might not be part of URL)
-                    url = url.rstrip('.,;:!?)')
-                    if url:
-                        all_sources.append(url)
-                        
-            except Exception as e:
-                # Citations not available - that's okay, we'll rely on the response text
-                pass
+                response = self._invoke(self._build_batch_prompt([queries[i] for i in pending]))
+                answers = self._split_batch_answers(self._extract_text(response), len(pending))
+            except Exception:
+                answers = None
             
-            # Filter and validate URLs
-            sources = self._extract_valid_urls(all_sources)
+            if answers is not None:
+                for i, answer in zip(pending, answers):
+                    results[i] = self._cache_result((normalize_query(queries[i]), num_results), answer)
+        
+        # Not batched (single query) or the batch could not be split
+        return [
+            result if result is not None else self.search(query, num_results=num_results)
+            for query, result in zip(queries, results)
+        ]
+    
+    async def asearch_many(self, queries: Iterable[str], num_results: int = 5) -> List[str]:
+        """
+        Runs several searches concurrently.
+        
+        Args:
+            queries: Search queries
+            num_results: Number of results to return per query (for formatting)
             
-            # Format response with clear structure
-            # The content will be in the language of the query
-            formatted = result_text
+        Returns:
+            Formatted results, in the same order as the queries
+        """
+        return list(await asyncio.gather(
+            *(self.asearch(query, num_results=num_results) for query in queries)
+        ))
+    
+    async def _ainvoke(self, prompt: str):
+        """Calls Gemini with Google Search using the async client when available."""
+        aio = getattr(self.client, 'aio', None)
+        if self._search_config is not None and aio is not None:
+            return await aio.models.generate_content(
+                model=Config.LLM_MODEL,
+                contents=prompt,
+                config=self._search_config
+            )
+        
+        # No async API for this format/version: run the blocking call in a worker thread
+        return await asyncio.to_thread(self._invoke, prompt)
+    
+    def _join_flight(self, cache_key: tuple) -> Tuple[Future, bool]:
+        """
+        Registers interest in a query's result.
+        
+        Args:
+            cache_key: Normalized query key
             
-            # Note: We don't include URLs in the sources section because
-            # the URLs from Gemini's grounding metadata are often invalid (404) or incomplete.
-            # The information itself is reliable and complete in the response text.
-            # If URLs are needed, they should be mentioned in the response content by the agent.
+        Returns:
+            (future for the result, True if the caller must run the query itself)
+        """
+        with self._inflight_lock:
+            flight = self._inflight.get(cache_key)
+            if flight is not None:
+                return flight, False
+            flight = self._inflight[cache_key] = Future()
+            return flight, True
+    
+    def _finish_flight(self, cache_key: tuple, flight: Future, result: str) -> str:
+        """Caches a query's result and hands it to the callers waiting for it."""
+        self._cache_result(cache_key, result)
+        with self._inflight_lock:
+            self._inflight.pop(cache_key, None)
+        flight.set_result(result)
+        return result
+    
+    def _abandon_flight(self, cache_key: tuple, flight: Future) -> None:
+        """Fails an interrupted query for the callers waiting for it."""
+        with self._inflight_lock:
+            self._inflight.pop(cache_key, None)
+        flight.set_exception(RuntimeError("Search was interrupted"))
+    
+    def _cached_result(self, cache_key: tuple) -> Optional[str]:
+        """Returns a cached result from memory, or from disk (promoting it to memory)."""
+        cached = self._cache.get(cache_key)
+        if cached is None:
+            cached = self._error_cache.get(cache_key)
+        if cached is None and self._disk_cache is not None:
+            cached = self._disk_cache.get(cache_key)
+            if cached is not None:
+                self._cache.put(cache_key, cached)
+        return cached
+    
+    def _cache_result(self, cache_key: tuple, result: str) -> str:
+        """Caches a formatted result (errors only briefly, in memory), and returns it."""
+        if result.startswith("Error"):
+            self._error_cache.put(cache_key, result)
+        else:
+            self._cache.put(cache_key, result)
+            if self._disk_cache is not None:
+                self._disk_cache.put(cache_key, result)
+        return result
+    
+    def cache_clear(self, persistent: bool = False) -> None:
+        """
+        Drops the cached search results held in memory.
+        
+        Args:
+            persistent: Also wipe the on-disk cache shared across runs (e.g. to force fresh results)
+        """
+        self._cache.clear()
+        self._error_cache.clear()
+        if persistent and self._disk_cache is not None:
+            self._disk_cache.clear()
+    
+    @staticmethod
+    def _build_prompt(query: str) -> str:
+        """Builds the search prompt for a query."""
+        # Use Gemini with Google Search grounding (integrated search)
+        # This enables Google Search directly in the model
+        # The query language is preserved - results will be returned and should be translated by the agent
+        return (
+            f"Search the internet for information about: {query}. "
+            "Provide a detailed, comprehensive answer with specific facts, data, and sources. "
+            "Include relevant URLs and citations where applicable. "
+            "Provide the response in the same language as the query if possible."
+        )
+    
+    @staticmethod
+    def _build_batch_prompt(queries: List[str]) -> str:
+        """Builds a single search prompt asking for one labeled answer per query."""
+        questions = "\n\n".join(f"Q{i}: {query}" for i, query in enumerate(queries, 1))
+        return (
+            "Search the internet for information about each of the following questions.\n\n"
+            f"{questions}\n\n"
+            "Answer each Qi separately and prefix each answer with a line of the form '### Ai:' "
+            "(e.g. '### A1:' for Q1). "
+            "Provide detailed, comprehensive answers with specific facts, data, and sources. "
+            "Include relevant URLs and citations where applicable. "
+            "Provide each answer in the same language as its question if possible."
+        )
+    
+    @staticmethod
+    def _split_batch_answers(text: str, count: int) -> Optional[List[str]]:
+        """
+        Splits a batched answer on its '### Ai:' headers.
+        
+        Returns:
+            The answers in question order, or None if any answer is missing
+        """
+        parts = _BATCH_ANSWER_RE.split(text or "")
+        answers = {int(number): body.strip() for number, body in zip(parts[1::2], parts[2::2])}
+        if sorted(answers) != list(range(1, count + 1)) or not all(answers.values()):
+            return None
+        return [answers[i] for i in range(1, count + 1)]
+    
+    def _format_response(self, response, num_results: int) -> str:
+        """
+        Extracts the answer text from a Gemini search response.
+        
+        Args:
+            response: Response returned by generate_content
+            num_results: Maximum number of sources to keep
             
-            return formatted
+        Returns:
+            Formatted search results as a string
+        """
+        if not response:
+            return "Error: No response received from search."
+        
+        # Extract text from response
+        result_text = self._extract_text(response)
+        if not result_text:
+            return "No results found on the internet."
+        
+        # Format response with clear structure
+        # The content will be in the language of the query
+        return result_text + self._format_sources([response], result_text, num_results)
+    
+    def _format_sources(self, responses: List, result_text: str, num_results: int) -> str:
+        """
+        Builds the "Sources:" section appended to a search answer.
+        
+        Args:
+            responses: Gemini response (or the chunks of a streamed response)
+            result_text: Answer text of the response
+            num_results: Maximum number of sources to keep
             
-        except Exception as e:
-            return f"Error searching internet: {str(e)}"
+        Returns:
+            The sources section, or an empty string if there is none
+        """
+        # Note: By default we don't include a sources section because
+        # the URLs from Gemini's grounding metadata are often invalid (404) or incomplete.
+        # The information itself is reliable and complete in the response text.
+        # If URLs are needed, they should be mentioned in the response content by the agent.
+        if not Config.INCLUDE_SOURCES:
+            return ""
+        
+        # Candidates are produced lazily, so collection stops as soon as enough
+        # valid URLs are found (the response text is only scanned when
+        # grounding metadata falls short)
+        try:
+            sources = self._extract_valid_urls(
+                self._iter_source_urls(responses, result_text),
+                limit=num_results
+            )
+        except Exception:
+            # Citations not available - that's okay, we'll rely on the response text
+            sources = []
+        if not sources:
+            return ""
+        return "\n\nSources:\n" + "\n".join(f"- {url}" for url in sources)
     
     def format_results(self, results: str) -> str:
         """
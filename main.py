@@ -2,28 +2,35 @@
 Main script to run the mechanical agent.
 Example usage and vehicle configuration.
 """
-import os
 import sys
-from pathlib import Path
-from dotenv import load_dotenv
-
-# Load environment variables
-load_dotenv()
 
+# Importing config loads the .env file
 from config import Config
-from pdf_indexer import PDFIndexer
-from agent import MechanicalAgent
 
 
 def build_index_if_needed():
     """Builds the PDF index if it doesn't exist."""
-    if Config.INDEX_PATH.exists():
+    # Scripted runs can skip the check entirely (SKIP_INDEX_CHECK=1)
+    if Config.SKIP_INDEX_CHECK:
+        return
+    
+    # The ready marker is written after a complete save (the index and metadata
+    # files are still checked, in case they were deleted since); indexes built
+    # before the marker existed are recognized by the index file itself
+    if Config.INDEX_READY_PATH.exists():
+        index_ready = Config.INDEX_PATH.exists() and Config.METADATA_PATH.exists()
+    else:
+        index_ready = Config.INDEX_PATH.exists()
+    if index_ready:
         print("✅ Index already exists. Skipping indexing.\n")
         return
     
     print("📚 Building manual index...")
     print("⚠️ This may take several minutes for large PDFs (~350MB)\n")
     
+    # Imported here: FAISS and sentence-transformers take seconds to load
+    from pdf_indexer import PDFIndexer
+    
     indexer = PDFIndexer()
     indexer.build_index()
     print("\n✅ Index built successfully\n")
@@ -80,6 +87,9 @@ def main():
     # Initialize agent
     print("🤖 Initializing agent...")
     try:
+        # Imported only once the configuration checks above have passed
+        from agent import MechanicalAgent
+        
         agent = MechanicalAgent(model=Config.LLM_MODEL)
     except Exception as e:
         print(f"❌ Error initializing agent: {e}")
@@ -2,18 +2,226 @@
 PDF indexer with embeddings and vector storage.
 Implements chunk-based indexing, lazy loading and hybrid search.
 """
+import asyncio
 import json
+import math
 import os
+import pickle
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache
+from itertools import chain, repeat
 from pathlib import Path
-from typing import List, Dict, Tuple, Optional
+from typing import List, Dict, Iterator, Tuple, Optional
 import numpy as np
 import faiss
 from sentence_transformers import SentenceTransformer
 import fitz  # PyMuPDF
 from tqdm import tqdm
-import pickle
+
+try:
+    import orjson  # Optional: faster parsing of the (large) metadata files
+except ImportError:
+    orjson = None
 
 from config import Config
+from query_cache import QueryCache, SemanticQueryCache, normalize_query
+
+
+# PDFs with fewer pages are read in-process (starting workers costs more)
+_PARALLEL_MIN_PAGES = 8
+# Page reading stops scaling beyond a handful of worker processes
+_MAX_PAGE_WORKERS = 6
+# Pages read per worker task (each task opens the PDF once)
+_PAGES_PER_TASK = 16
+# Chunks encoded per block while building (bounds the embeddings held in memory)
+_EMBED_BLOCK_SIZE = 4096
+# Words matched by keyword search
+_WORD_RE = re.compile(r"\w+")
+# int8 kernel set of the quantized ONNX model ("avx512_vnni" is faster on CPUs that have it)
+_ONNX_QUANTIZATION = "avx2"
+# Similarity from which a query reuses the semantic results of an earlier one
+# (stricter than the tool-level SEMANTIC_CACHE_THRESHOLD: these are raw results)
+_SEMANTIC_RESULTS_CACHE_THRESHOLD = 0.97
+# Guards the documents cached by _open_pdf() (PyMuPDF documents are not thread-safe)
+_PDF_LOCK = threading.Lock()
+
+
+def _load_json(path: Path):
+    """Loads a JSON file, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(path.read_bytes())
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+@lru_cache(maxsize=None)
+def _configure_torch_threads() -> None:
+    """
+    Sets the PyTorch CPU thread count once per process (TORCH_THREADS, default:
+    the CPUs available to this process minus one). Inside containers the
+    detected default can be far from the CPUs actually granted.
+    The page-reading worker processes don't run PyTorch, so they are not affected.
+    """
+    import torch  # Installed with sentence-transformers
+    
+    threads = Config.TORCH_THREADS
+    if threads <= 0:
+        available = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+        threads = max(1, available - 1)
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(2)
+    except RuntimeError:
+        # Only allowed before PyTorch starts any inter-op work
+        pass
+
+
+def _load_embedding_model() -> SentenceTransformer:
+    """
+    Loads the embedding model.
+    With EMBEDDING_BACKEND=onnx, an int8-quantized ONNX export is used instead
+    of PyTorch; it is exported on first use and cached under the vector store.
+    Falls back to PyTorch if the ONNX backend is not installed.
+    PyTorch uses the GPU automatically when one is available (unless USE_GPU is off).
+    """
+    device = None if Config.USE_GPU else "cpu"
+    if Config.EMBEDDING_BACKEND != "onnx":
+        return SentenceTransformer(Config.EMBEDDING_MODEL, device=device)
+    
+    onnx_dir = Config.VECTOR_STORE_PATH / "onnx_model"
+    quantized_file = f"onnx/model_qint8_{_ONNX_QUANTIZATION}.onnx"
+    try:
+        if not (onnx_dir / quantized_file).exists():
+            # Needs sentence-transformers >= 3.2 with the onnx extra
+            from sentence_transformers import export_dynamic_quantized_onnx_model
+            
+            print("⚙️ Exporting embedding model to ONNX (int8)...")
+            model = SentenceTransformer(Config.EMBEDDING_MODEL, backend="onnx")
+            model.save(str(onnx_dir))
+            export_dynamic_quantized_onnx_model(model, _ONNX_QUANTIZATION, str(onnx_dir))
+        return SentenceTransformer(
+            str(onnx_dir),
+            backend="onnx",
+            model_kwargs={"file_name": quantized_file}
+        )
+    except Exception as e:
+        print(f"⚠️ ONNX embedding backend not available ({e}). Using PyTorch.")
+        return SentenceTransformer(Config.EMBEDDING_MODEL, device=device)
+
+
+def _read_index(path: Path) -> faiss.Index:
+    """
+    Reads a FAISS index memory-mapped (read-only), so worker processes share
+    the OS page cache.
+    Flat indexes are only mapped with IO_FLAG_MMAP_IFC (faiss >= 1.9), which
+    IVF-PQ indexes reject; their inverted lists are mapped by IO_FLAG_MMAP
+    alone. The flag sets are tried in that order, and index types that can't
+    be mapped at all are read into memory.
+    """
+    mmap_flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+    attempts = [mmap_flags]
+    if hasattr(faiss, "IO_FLAG_MMAP_IFC"):
+        attempts.insert(0, mmap_flags | faiss.IO_FLAG_MMAP_IFC)
+    
+    error = None
+    for flags in attempts:
+        try:
+            index = faiss.read_index(str(path), flags)
+        except RuntimeError as e:
+            error = e
+            continue
+        print("✅ Index memory-mapped")
+        return index
+    
+    print(f"⚠️ Index can't be memory-mapped ({error}). Loading it into memory.")
+    return faiss.read_index(str(path))
+
+
+@lru_cache(maxsize=1)
+def _gpu_resources() -> "faiss.StandardGpuResources":
+    """Shared FAISS GPU resources (must outlive every index moved to the GPU)."""
+    return faiss.StandardGpuResources()
+
+
+@lru_cache(maxsize=4)
+def _open_pdf(pdf_path: str) -> "fitz.Document":
+    """
+    Opens a PDF and keeps it open for later image extractions (opening a large
+    PDF is not free). Use the returned document while holding _PDF_LOCK.
+    """
+    return fitz.open(pdf_path)
+
+
+def _extract_pages(pdf_path: str, start: int, stop: int, with_text: bool = True) -> List[Tuple[str, int, List[Dict]]]:
+    """
+    Extracts text and image information from pages start..stop-1 (0-indexed).
+    Module-level so it can run in worker processes.
+    
+    Returns:
+        List of tuples (text, page_number, images_info), page numbers 1-indexed
+        (text is empty when with_text is False)
+    """
+    pages = []
+    with fitz.open(pdf_path) as doc:
+        for page_index in range(start, stop):
+            page = doc[page_index]
+            pages.append((
+                page.get_text() if with_text else "",
+                page_index + 1,
+                PDFIndexer.extract_images_from_page(page, page_index + 1)
+            ))
+    return pages
+
+
+@dataclass
+class ChunkStore:
+    """
+    Chunk metadata stored column-wise: one array per field instead of one dict
+    per chunk. Row i is the chunk of FAISS id i; store[i] returns it as a dict.
+    """
+    texts: np.ndarray  # object (str)
+    pages: np.ndarray  # int32
+    starts: np.ndarray  # int32, start position in the page text
+    ends: np.ndarray  # int32, end position in the page text
+    
+    @classmethod
+    def from_chunks(cls, chunks: List[Dict]) -> "ChunkStore":
+        """Builds the store from chunk dicts (as returned by create_chunks)."""
+        count = len(chunks)
+        texts = np.empty(count, dtype=object)
+        texts[:] = [chunk["text"] for chunk in chunks]
+        return cls(
+            texts=texts,
+            pages=np.fromiter((chunk["page"] for chunk in chunks), dtype=np.int32, count=count),
+            starts=np.fromiter((chunk["start_pos"] for chunk in chunks), dtype=np.int32, count=count),
+            ends=np.fromiter((chunk["end_pos"] for chunk in chunks), dtype=np.int32, count=count)
+        )
+    
+    @classmethod
+    def load(cls, path: Path) -> "ChunkStore":
+        """Loads a store written by save()."""
+        # The texts column is an object array, which numpy stores pickled
+        with np.load(path, allow_pickle=True) as data:
+            return cls(texts=data["texts"], pages=data["pages"], starts=data["starts"], ends=data["ends"])
+    
+    def save(self, path: Path) -> None:
+        """Writes all columns to a single .npz file."""
+        with open(path, 'wb') as f:
+            np.savez(f, texts=self.texts, pages=self.pages, starts=self.starts, ends=self.ends)
+    
+    def __len__(self) -> int:
+        return len(self.texts)
+    
+    def __getitem__(self, idx: int) -> Dict:
+        return {
+            "text": self.texts[idx],
+            "page": int(self.pages[idx]),
+            "start_pos": int(self.starts[idx]),
+            "end_pos": int(self.ends[idx])
+        }
 
 
 class PDFIndexer:
@@ -21,45 +229,75 @@ class PDFIndexer:
     
     def __init__(self):
         """Initializes the indexer."""
-        self.embedding_model = SentenceTransformer(Config.EMBEDDING_MODEL)
+        _configure_torch_threads()
+        self.embedding_model = _load_embedding_model()
         self.index: Optional[faiss.Index] = None
-        self.metadata: List[Dict] = []
+        self._index_on_gpu = False
+        self.metadata: ChunkStore = ChunkStore.from_chunks([])
         self.chunks: List[str] = []
         self.images_metadata: Dict[int, List[Dict]] = {}  # Page -> List of images
+        self._keyword_index: Optional[Dict[str, np.ndarray]] = None  # Word -> ids of chunks containing it
+        # Query embeddings by normalized query text (searches run in worker threads;
+        # the caches are thread-safe)
+        self._query_embeddings = QueryCache(Config.QUERY_CACHE_SIZE)
+        # Semantic search results of recent queries (used by hybrid search), matched by query embedding
+        self._semantic_results_cache = SemanticQueryCache(
+            Config.QUERY_CACHE_SIZE, threshold=_SEMANTIC_RESULTS_CACHE_THRESHOLD
+        )
+        # Serializes searches on the GPU index (FAISS GPU indexes are not thread-safe)
+        self._gpu_search_lock = threading.Lock()
         
-    def extract_images_from_page(self, page, page_num: int) -> List[Dict]:
+    @staticmethod
+    def extract_images_from_page(page, page_num: int) -> List[Dict]:
         """
         Extracts information about images/diagrams from a page.
         Returns a list of dictionaries with image information.
         """
         images_info = []
         try:
-            # Get list of images on the page
+            # Images referenced by the page: xref, width and height (cheap; no pixel data is read)
             image_list = page.get_images()
+            if not image_list:
+                return images_info
             
+            image_indexes: Dict[int, int] = {}
+            xrefs_by_size: Dict[Tuple[int, int], set] = {}
             for img_index, img in enumerate(image_list):
                 # img is a tuple: (xref, smask, width, height, bpc, colorspace, alt, name, filter, referencer)
                 xref = img[0]
-                width = img[2]
-                height = img[3]
-                
-                # Get rectangles where the image appears
-                image_rects = page.get_image_rects(xref)
-                
-                for rect in image_rects:
-                    images_info.append({
-                        "xref": xref,
-                        "index": img_index,
-                        "width": width,
-                        "height": height,
-                        "rect": {
-                            "x0": rect.x0,
-                            "y0": rect.y0,
-                            "x1": rect.x1,
-                            "y1": rect.y1
-                        },
-                        "area": (rect.x1 - rect.x0) * (rect.y1 - rect.y0)  # Area to determine size
-                    })
+                image_indexes.setdefault(xref, img_index)
+                xrefs_by_size.setdefault((img[2], img[3]), set()).add(xref)
+            
+            # Every placement of every image with its bounding box, in one page scan
+            # (instead of a get_image_rects() scan per image). Placements are matched
+            # to their image by size; only pages with distinct images of the same
+            # size ask for xrefs, which makes MuPDF hash every image's pixels
+            placements = page.get_image_info()
+            if any(len(xrefs_by_size.get((info["width"], info["height"]), ())) > 1 for info in placements):
+                placements = page.get_image_info(xrefs=True)
+            
+            for info in placements:
+                xref = info.get("xref")
+                if xref is None:
+                    size_xrefs = xrefs_by_size.get((info["width"], info["height"]))
+                    xref = next(iter(size_xrefs)) if size_xrefs else 0
+                if not xref:
+                    # Inline image: has no xref, so it can't be extracted later
+                    continue
+                x0, y0, x1, y1 = info["bbox"]
+                images_info.append({
+                    "xref": xref,
+                    "index": image_indexes.setdefault(xref, len(image_indexes)),
+                    "width": info["width"],
+                    "height": info["height"],
+                    "rect": {
+                        "x0": x0,
+                        "y0": y0,
+                        "x1": x1,
+                        "y1": y1
+                    },
+                    "area": (x1 - x0) * (y1 - y0)  # Area to determine size
+                })
         except Exception as e:
             # If there's an error, continue without images
             pass
@@ -73,29 +311,54 @@ class PDFIndexer:
         Returns a list of tuples (text, page_number).
         """
         print(f"📖 Extracting text and images from {pdf_path}...")
-        doc = fitz.open(pdf_path)
         pages_text = []
         
         # Create folder for images if it doesn't exist
         Config.IMAGES_PATH.mkdir(parents=True, exist_ok=True)
         
-        for page_num in tqdm(range(len(doc)), desc="Processing pages"):
-            page = doc[page_num]
-            text = page.get_text()
-            
-            # Extract image information
-            images_info = self.extract_images_from_page(page, page_num + 1)
+        for text, page_num, images_info in self._iter_pages(pdf_path, desc="Processing pages"):
+            # Image information
             if images_info:
-                self.images_metadata[page_num + 1] = images_info
+                self.images_metadata[page_num] = images_info
             
             if text.strip():
-                pages_text.append((text, page_num + 1))
+                pages_text.append((text, page_num))
         
-        doc.close()
         print(f"✅ Extracted {len(pages_text)} pages with content")
         print(f"✅ Detected images on {len(self.images_metadata)} pages")
         return pages_text
     
+    @staticmethod
+    def _iter_pages(pdf_path: Path, desc: str, with_text: bool = True) -> Iterator[Tuple[str, int, List[Dict]]]:
+        """
+        Yields (text, page_number, images_info) for every page, in page order.
+        This is the only PDF page walk: text and image information come from the
+        same pass (with_text=False skips the text when only images are needed).
+        Large PDFs are read by a pool of worker processes, _PAGES_PER_TASK pages
+        per task; the workers only run PyMuPDF, not the embedding model.
+        """
+        with fitz.open(pdf_path) as doc:
+            page_count = len(doc)
+        starts = list(range(0, page_count, _PAGES_PER_TASK))
+        stops = [min(start + _PAGES_PER_TASK, page_count) for start in starts]
+        
+        with tqdm(total=page_count, desc=desc) as progress:
+            if page_count < _PARALLEL_MIN_PAGES:
+                batches = (
+                    _extract_pages(str(pdf_path), start, stop, with_text)
+                    for start, stop in zip(starts, stops)
+                )
+                for pages in batches:
+                    progress.update(len(pages))
+                    yield from pages
+                return
+            
+            workers = min(os.cpu_count() or 1, _MAX_PAGE_WORKERS)
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                for pages in executor.map(_extract_pages, repeat(str(pdf_path)), starts, stops, repeat(with_text)):
+                    progress.update(len(pages))
+                    yield from pages
+    
     def create_chunks(self, pages_text: List[Tuple[str, int]]) -> List[Dict]:
         """
         Divides text into chunks with metadata.
@@ -103,44 +366,43 @@ class PDFIndexer:
         """
         print("✂️ Creating text chunks...")
         chunks = []
+        size = Config.CHUNK_SIZE
+        # Chunks start every CHUNK_SIZE - CHUNK_OVERLAP characters
+        step = max(1, size - Config.CHUNK_OVERLAP)
         
         for text, page_num in pages_text:
-            # Split text into chunks
+            # Chunk boundaries are computed up front; each slice is stripped once
             text_length = len(text)
-            start = 0
-            
-            while start < text_length:
-                end = start + Config.CHUNK_SIZE
-                chunk_text = text[start:end]
-                
-                if chunk_text.strip():
-                    chunks.append({
-                        "text": chunk_text.strip(),
-                        "page": page_num,
-                        "start_pos": start,
-                        "end_pos": min(end, text_length)
-                    })
-                
-                # Move start with overlap
-                start = end - Config.CHUNK_OVERLAP
-                if start >= text_length:
-                    break
+            chunks.extend(
+                {
+                    "text": chunk_text,
+                    "page": page_num,
+                    "start_pos": start,
+                    "end_pos": min(start + size, text_length)
+                }
+                for start in range(0, text_length, step)
+                if (chunk_text := text[start:start + size].strip())
+            )
         
         print(f"✅ Created {len(chunks)} chunks")
         return chunks
     
-    def generate_embeddings(self, chunks: List[Dict]) -> np.ndarray:
-        """Generates embeddings for all chunks."""
-        print("🧮 Generating embeddings...")
-        texts = [chunk["text"] for chunk in chunks]
-        embeddings = self.embedding_model.encode(
-            texts,
-            show_progress_bar=True,
-            batch_size=32,
-            convert_to_numpy=True
-        )
-        print(f"✅ Generated {len(embeddings)} embeddings of dimension {embeddings.shape[1]}")
-        return embeddings
+    def iter_embeddings(self, chunks: List[Dict]) -> Iterator[np.ndarray]:
+        """
+        Yields the L2-normalized float32 embeddings of the chunks, one block of
+        _EMBED_BLOCK_SIZE chunks at a time, so the index can be filled without
+        holding every embedding in memory.
+        SentenceTransformer.encode() batches the texts sorted by length (and
+        restores the input order), so each batch is padded to similar lengths.
+        """
+        for start in tqdm(range(0, len(chunks), _EMBED_BLOCK_SIZE), desc="Generating embeddings"):
+            texts = [chunk["text"] for chunk in chunks[start:start + _EMBED_BLOCK_SIZE]]
+            yield self.embedding_model.encode(
+                texts,
+                batch_size=Config.EMBEDDING_BATCH_SIZE,
+                convert_to_numpy=True,
+                normalize_embeddings=True
+            ).astype(np.float32, copy=False)
     
     def build_index(self, pdf_path: Optional[Path] = None) -> None:
         """
@@ -151,14 +413,24 @@ class PDFIndexer:
         pdf_path = pdf_path or Config.MANUAL_PDF_PATH
         
         # Check if index already exists
-        if Config.INDEX_PATH.exists() and Config.METADATA_PATH.exists():
+        if Config.INDEX_PATH.exists() and (
+            Config.METADATA_PATH.exists() or Config.LEGACY_METADATA_PATH.exists()
+        ):
             print("📂 Existing index found. Loading...")
             self.load_index()
             
             # If image metadata is missing, extract it
-            if not Config.IMAGES_METADATA_PATH.exists() or not self.images_metadata:
+            if not self.images_metadata:
                 print("📷 Image metadata not found. Extracting images...")
-                self._extract_images_metadata(pdf_path)
+                for _, page_num, images_info in self._iter_pages(pdf_path, desc="Extracting images", with_text=False):
+                    if images_info:
+                        self.images_metadata[page_num] = images_info
+                
+                if self.images_metadata:
+                    self._save_images_metadata()
+                    print(f"✅ Image metadata saved: {len(self.images_metadata)} pages with images")
+                else:
+                    print("⚠️ No images found in PDF")
             return
         
         # Create directory if it doesn't exist
@@ -171,67 +443,158 @@ class PDFIndexer:
         chunks = self.create_chunks(pages_text)
         self.chunks = chunks
         
-        # Generate embeddings
-        embeddings = self.generate_embeddings(chunks)
-        
-        # Create FAISS index
-        dimension = embeddings.shape[1]
-        self.index = faiss.IndexFlatL2(dimension)
-        self.index.add(embeddings.astype('float32'))
+        # Generate embeddings and create the FAISS index
+        # (unit-length vectors: inner product = cosine similarity)
+        print("🧮 Generating embeddings...")
+        self.index = self._create_index(len(chunks), self.iter_embeddings(chunks))
+        self._index_on_gpu = False
         
         # Save metadata
-        self.metadata = chunks
+        self.metadata = ChunkStore.from_chunks(chunks)
+        self._keyword_index = None
+        self._semantic_results_cache.clear()
         
-        # Save index
+        # Save index (includes the image metadata)
         self.save_index()
-        
-        # Save image metadata
-        if self.images_metadata:
-            with open(Config.IMAGES_METADATA_PATH, 'w', encoding='utf-8') as f:
-                json.dump(self.images_metadata, f, ensure_ascii=False, indent=2)
+        self._move_index_to_gpu()
         
         print("✅ Index built and saved successfully")
     
-    def _extract_images_metadata(self, pdf_path: Path) -> None:
+    @staticmethod
+    def _create_index(count: int, batches: Iterator[np.ndarray]) -> faiss.Index:
         """
-        Extracts image metadata from an already indexed PDF.
-        """
-        print(f"📷 Extracting image information from {pdf_path}...")
-        doc = fitz.open(pdf_path)
-        
-        for page_num in tqdm(range(len(doc)), desc="Extracting images"):
-            page = doc[page_num]
-            images_info = self.extract_images_from_page(page, page_num + 1)
-            if images_info:
-                self.images_metadata[page_num + 1] = images_info
-        
-        doc.close()
+        Creates the FAISS index and adds the (L2-normalized) embeddings.
+        Inner-product indexes are used, so search scores are cosine similarities.
+        Small manuals use a flat index storing the vectors as float16 (half the
+        memory and bandwidth of float32, same ranking in practice); batches are
+        added as they arrive. From INDEX_IVF_MIN_CHUNKS chunks on, an IVF-PQ
+        index is used: vectors are stored as compact PQ codes and each search
+        only scans the INDEX_NPROBE closest clusters.
         
-        # Save image metadata
-        if self.images_metadata:
-            with open(Config.IMAGES_METADATA_PATH, 'w', encoding='utf-8') as f:
-                json.dump(self.images_metadata, f, ensure_ascii=False, indent=2)
-            print(f"✅ Image metadata saved: {len(self.images_metadata)} pages with images")
+        Args:
+            count: Total number of embeddings
+            batches: Embedding blocks, in chunk order
+        """
+        first = next(batches, None)
+        if first is None:
+            raise ValueError("No text found in the PDF to index.")
+        dimension = first.shape[1]
+        batches = chain([first], batches)
+        
+        if count < Config.INDEX_IVF_MIN_CHUNKS:
+            index = faiss.IndexScalarQuantizer(
+                dimension, faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_INNER_PRODUCT
+            )
+            for batch in batches:
+                index.add(batch)
         else:
-            print("⚠️ No images found in PDF")
+            # Training needs every vector: fill one float32 matrix in place
+            embeddings = np.empty((count, dimension), dtype=np.float32)
+            start = 0
+            for batch in batches:
+                embeddings[start:start + len(batch)] = batch
+                start += len(batch)
+            
+            nlist = max(1, int(4 * math.sqrt(count)))
+            # The number of sub-quantizers must divide the dimension (384 -> 32 x 12)
+            m = math.gcd(dimension, 32)
+            quantizer = faiss.IndexFlatIP(dimension)
+            index = faiss.IndexIVFPQ(quantizer, dimension, nlist, m, 8, faiss.METRIC_INNER_PRODUCT)
+            print(f"🧭 Training IVF-PQ index ({nlist} clusters, {m} sub-quantizers)...")
+            index.train(embeddings)
+            index.nprobe = Config.INDEX_NPROBE  # Stored in the index file
+            index.add(embeddings)
+        
+        print(f"✅ Generated {index.ntotal} embeddings of dimension {dimension}")
+        return index
     
     def save_index(self) -> None:
         """Saves index and metadata to disk."""
         print("💾 Saving index...")
         
-        # Save FAISS index
-        faiss.write_index(self.index, str(Config.INDEX_PATH))
+        # An interrupted save must not leave the marker of an earlier index behind
+        Config.INDEX_READY_PATH.unlink(missing_ok=True)
+        
+        # Save FAISS index (always as a CPU index)
+        index = faiss.index_gpu_to_cpu(self.index) if self._index_on_gpu else self.index
+        faiss.write_index(index, str(Config.INDEX_PATH))
         
         # Save metadata
-        with open(Config.METADATA_PATH, 'w', encoding='utf-8') as f:
-            json.dump(self.metadata, f, ensure_ascii=False, indent=2)
+        self.metadata.save(Config.METADATA_PATH)
         
         # Save image metadata
-        with open(Config.IMAGES_METADATA_PATH, 'w', encoding='utf-8') as f:
-            json.dump(self.images_metadata, f, ensure_ascii=False, indent=2)
+        self._save_images_metadata()
+        
+        # Save the keyword index, so keyword search doesn't tokenize every chunk after loading
+        self._save_keyword_index()
+        
+        # Human-readable copies for debugging (not read back when the binary files exist)
+        if Config.EXPORT_METADATA_JSON:
+            with open(Config.LEGACY_METADATA_PATH, 'w', encoding='utf-8') as f:
+                json.dump([self.metadata[i] for i in range(len(self.metadata))], f, ensure_ascii=False, indent=2)
+            with open(Config.LEGACY_IMAGES_METADATA_PATH, 'w', encoding='utf-8') as f:
+                json.dump(self.images_metadata, f, ensure_ascii=False, indent=2)
+        
+        # Mark the index as complete (checked by main.py before starting the agent)
+        Config.INDEX_READY_PATH.touch()
         
         print("✅ Index saved")
     
+    def _move_index_to_gpu(self) -> None:
+        """
+        Moves the search index to the GPU when faiss-gpu and a GPU are available
+        (and USE_GPU is on). Searching on CPU is kept if the move fails.
+        The float16 flat index has no GPU clone, so its vectors are moved as a
+        flat inner-product index stored as float16 on the GPU.
+        """
+        if not Config.USE_GPU or not hasattr(faiss, "StandardGpuResources") or faiss.get_num_gpus() == 0:
+            return
+        index = self.index
+        if isinstance(index, faiss.IndexScalarQuantizer):
+            flat = faiss.IndexFlat(index.d, index.metric_type)
+            flat.add(index.reconstruct_n(0, index.ntotal))
+            index = flat
+        try:
+            # float16 storage on the GPU as well
+            options = faiss.GpuClonerOptions()
+            options.useFloat16 = True
+            gpu_index = faiss.index_cpu_to_gpu(_gpu_resources(), 0, index, options)
+        except RuntimeError as e:
+            print(f"⚠️ Could not move the index to the GPU ({e}). Searching on CPU.")
+            return
+        if isinstance(gpu_index, faiss.GpuIndex):
+            self.index = gpu_index
+            self._index_on_gpu = True
+            print("✅ Index moved to GPU")
+    
+    def _save_keyword_index(self) -> None:
+        """
+        Writes the keyword index to disk as three flat arrays (words, posting
+        offsets and concatenated chunk ids), which pickle much faster than
+        one small array per word.
+        """
+        keyword_index = self._get_keyword_index()
+        words = list(keyword_index)
+        lengths = np.fromiter((len(keyword_index[word]) for word in words), dtype=np.int64, count=len(words))
+        offsets = np.concatenate(([0], np.cumsum(lengths)))
+        chunk_ids = np.concatenate([keyword_index[word] for word in words]) if words else np.empty(0, dtype=np.int32)
+        with open(Config.KEYWORD_INDEX_PATH, 'wb') as f:
+            pickle.dump((words, offsets, chunk_ids), f, protocol=pickle.HIGHEST_PROTOCOL)
+    
+    def _load_keyword_index(self) -> Optional[Dict[str, np.ndarray]]:
+        """Loads the keyword index written by save_index(), or None if there is none."""
+        if not Config.KEYWORD_INDEX_PATH.exists():
+            return None
+        with open(Config.KEYWORD_INDEX_PATH, 'rb') as f:
+            words, offsets, chunk_ids = pickle.load(f)
+        # Postings are views into the single chunk_ids array
+        return {word: chunk_ids[start:end] for word, start, end in zip(words, offsets[:-1], offsets[1:])}
+    
+    def _save_images_metadata(self) -> None:
+        """Writes the image metadata to disk (pickled: compact, fast to load, keeps int keys)."""
+        with open(Config.IMAGES_METADATA_PATH, 'wb') as f:
+            pickle.dump(self.images_metadata, f, protocol=pickle.HIGHEST_PROTOCOL)
+    
     def load_index(self) -> None:
         """Loads index and metadata from disk."""
         print("📂 Loading index...")
@@ -239,17 +602,25 @@ class PDFIndexer:
         if not Config.INDEX_PATH.exists():
             raise FileNotFoundError(f"Index not found at {Config.INDEX_PATH}")
         
-        # Load FAISS index
-        self.index = faiss.read_index(str(Config.INDEX_PATH))
+        self.index = _read_index(Config.INDEX_PATH)
+        self._index_on_gpu = False
+        self._move_index_to_gpu()
         
-        # Load metadata
-        with open(Config.METADATA_PATH, 'r', encoding='utf-8') as f:
-            self.metadata = json.load(f)
+        # Load metadata (indexes saved before the column store have a JSON list)
+        if Config.METADATA_PATH.exists():
+            self.metadata = ChunkStore.load(Config.METADATA_PATH)
+        else:
+            self.metadata = ChunkStore.from_chunks(_load_json(Config.LEGACY_METADATA_PATH))
+        # Indexes saved without a keyword index build it on the first keyword search
+        self._keyword_index = self._load_keyword_index()
+        self._semantic_results_cache.clear()
         
         # Load image metadata if it exists
         if Config.IMAGES_METADATA_PATH.exists():
-            with open(Config.IMAGES_METADATA_PATH, 'r', encoding='utf-8') as f:
-                self.images_metadata = json.load(f)
+            with open(Config.IMAGES_METADATA_PATH, 'rb') as f:
+                self.images_metadata = pickle.load(f)
+        elif Config.LEGACY_IMAGES_METADATA_PATH.exists():
+            self.images_metadata = _load_json(Config.LEGACY_IMAGES_METADATA_PATH)
             # Convert keys from string to int
             self.images_metadata = {int(k): v for k, v in self.images_metadata.items()}
         
@@ -257,6 +628,25 @@ class PDFIndexer:
         if self.images_metadata:
             print(f"✅ Image metadata loaded: {len(self.images_metadata)} pages with images")
     
+    def encode_query(self, query: str) -> np.ndarray:
+        """
+        Returns the float32 embedding vector for a query.
+        Embeddings are cached by normalized query text, so repeated queries skip
+        the model; the returned array is shared and read-only.
+        """
+        key = normalize_query(query)
+        embedding = self._query_embeddings.get(key)
+        if embedding is not None:
+            return embedding
+        
+        embedding = self.embedding_model.encode(
+            [key],
+            convert_to_numpy=True
+        ).astype('float32')[0]
+        embedding.setflags(write=False)
+        self._query_embeddings.put(key, embedding)
+        return embedding
+    
     def search_semantic(self, query: str, top_k: int = None) -> List[Dict]:
         """
         Semantic search using embeddings.
@@ -268,29 +658,46 @@ class PDFIndexer:
         top_k = top_k or Config.TOP_K_RESULTS
         
         # Generate query embedding
-        query_embedding = self.embedding_model.encode(
-            [query],
-            convert_to_numpy=True
-        ).astype('float32')
+        query_embedding = self.encode_query(query)[np.newaxis, :]
+        
+        # Cosine indexes return similarities directly; indexes built before
+        # the switch to cosine (L2 distances) use the old distance conversion
+        cosine = self.index.metric_type == faiss.METRIC_INNER_PRODUCT
+        if cosine:
+            query_embedding = query_embedding.copy()
+            faiss.normalize_L2(query_embedding)
         
         # Search in index
-        distances, indices = self.index.search(query_embedding, top_k)
-        
-        # Format results
-        results = []
-        for i, (distance, idx) in enumerate(zip(distances[0], indices[0])):
-            if idx < len(self.metadata):
-                similarity = 1 / (1 + distance)  # Convert distance to similarity
-                if similarity >= Config.SIMILARITY_THRESHOLD:
-                    chunk_data = self.metadata[idx]
-                    results.append({
-                        "text": chunk_data["text"],
-                        "page": chunk_data["page"],
-                        "similarity": float(similarity),
-                        "type": "semantic"
-                    })
-        
-        return results
+        if self._index_on_gpu:
+            with self._gpu_search_lock:
+                distances, indices = self.index.search(query_embedding, top_k)
+        else:
+            distances, indices = self.index.search(query_embedding, top_k)
+        
+        # Filter in one vectorized pass: FAISS pads missing results with id -1
+        ids = indices[0]
+        valid = (ids >= 0) & (ids < len(self.metadata))
+        ids = ids[valid]
+        similarities = distances[0][valid]
+        if not cosine:
+            similarities = 1 / (1 + similarities)  # Convert distance to similarity
+        keep = similarities >= Config.SIMILARITY_THRESHOLD
+        ids = ids[keep]
+        similarities = similarities[keep]
+        
+        # Format results (only for the hits that passed, columns gathered at once)
+        return [
+            {
+                "chunk_id": int(chunk_id),
+                "text": text,
+                "page": int(page),
+                "similarity": float(similarity),
+                "type": "semantic"
+            }
+            for chunk_id, text, page, similarity in zip(
+                ids, self.metadata.texts[ids], self.metadata.pages[ids], similarities
+            )
+        ]
     
     def search_keyword(self, query: str, top_k: int = None) -> List[Dict]:
         """
@@ -302,54 +709,79 @@ class PDFIndexer:
         
         top_k = top_k or Config.TOP_K_RESULTS
         
-        query_lower = query.lower()
-        query_words = set(query_lower.split())
-        
-        scored_chunks = []
-        
-        for chunk_data in self.metadata:
-            text_lower = chunk_data["text"].lower()
-            text_words = set(text_lower.split())
-            
-            # Calculate score: number of matching words
-            matches = len(query_words.intersection(text_words))
-            if matches > 0:
-                score = matches / len(query_words)
-                scored_chunks.append({
-                    "text": chunk_data["text"],
-                    "page": chunk_data["page"],
-                    "similarity": score,
-                    "type": "keyword"
-                })
-        
-        # Sort by score and return top_k
-        scored_chunks.sort(key=lambda x: x["similarity"], reverse=True)
-        return scored_chunks[:top_k]
+        query_words = set(_WORD_RE.findall(query.lower()))
+        keyword_index = self._get_keyword_index()
+        postings = [keyword_index[word] for word in query_words if word in keyword_index]
+        if not postings:
+            return []
+        
+        # Calculate score: number of matching words (only chunks containing
+        # at least one query word are touched)
+        chunk_ids, matches = np.unique(np.concatenate(postings), return_counts=True)
+        scores = matches / len(query_words)
+        
+        # Select top_k by score (ties keep document order), then gather their columns
+        top = self._top_k_order(scores, top_k)
+        top_ids = chunk_ids[top]
+        return [
+            {
+                "chunk_id": int(chunk_id),
+                "text": text,
+                "page": int(page),
+                "similarity": float(score),
+                "type": "keyword"
+            }
+            for chunk_id, text, page, score in zip(
+                top_ids, self.metadata.texts[top_ids], self.metadata.pages[top_ids], scores[top]
+            )
+        ]
+    
+    def _get_keyword_index(self) -> Dict[str, np.ndarray]:
+        """
+        Returns the inverted index used by keyword search (word -> sorted ids of
+        the chunks containing it), built from the metadata on first use.
+        """
+        if self._keyword_index is None:
+            postings: Dict[str, List[int]] = {}
+            for chunk_id, text in enumerate(self.metadata.texts):
+                for word in set(_WORD_RE.findall(text.lower())):
+                    postings.setdefault(word, []).append(chunk_id)
+            self._keyword_index = {word: np.array(ids, dtype=np.int32) for word, ids in postings.items()}
+        return self._keyword_index
     
     def search_hybrid(self, query: str, top_k: int = None) -> List[Dict]:
         """
         Hybrid search: combines semantic and keyword search.
         Returns merged and deduplicated results.
+        Each result carries the "chunk_id" (row in the FAISS index / metadata).
+        Paraphrases of a recent query (near-identical embedding) reuse its semantic
+        results; keyword search always runs, since it matches the query's exact terms
+        (e.g. "P0420" vs "P0430").
         """
         top_k = top_k or Config.TOP_K_RESULTS
         
         # Perform both searches
-        semantic_results = self.search_semantic(query, top_k * 2)
+        # (the embedding is cached, so search_semantic() doesn't encode again)
+        query_embedding = self.encode_query(query)
+        semantic_results = self._semantic_results_cache.get(query_embedding, key=top_k)
+        if semantic_results is None:
+            semantic_results = self.search_semantic(query, top_k * 2)
+            self._semantic_results_cache.put(query_embedding, semantic_results, key=top_k)
         keyword_results = self.search_keyword(query, top_k * 2)
         
         # Merge results
-        # Use a dictionary to deduplicate by page and similar text
+        # Use a dictionary to deduplicate by chunk id (the same chunk found by both searches)
         merged = {}
         
         # Add semantic results (higher weight)
         for result in semantic_results:
-            key = (result["page"], result["text"][:100])  # Use first 100 chars as key
+            key = result["chunk_id"]
             if key not in merged or merged[key]["similarity"] < result["similarity"]:
                 merged[key] = result
         
         # Add keyword results (lower weight)
         for result in keyword_results:
-            key = (result["page"], result["text"][:100])
+            key = result["chunk_id"]
             if key not in merged:
                 # Reduce keyword score to prioritize semantic
                 result["similarity"] = result["similarity"] * 0.7
@@ -359,11 +791,61 @@ class PDFIndexer:
                 if result["similarity"] > merged[key]["similarity"]:
                     merged[key] = result
         
-        # Convert to list and sort
+        # Convert to list and select the top_k
         results = list(merged.values())
-        results.sort(key=lambda x: x["similarity"], reverse=True)
+        similarities = np.fromiter((r["similarity"] for r in results), dtype=np.float64, count=len(results))
+        return [results[i] for i in self._top_k_order(similarities, top_k)]
+    
+    async def asearch_hybrid(self, query: str, top_k: int = None) -> List[Dict]:
+        """
+        Async hybrid search.
+        Runs search_hybrid() in a worker thread so several searches can be
+        awaited concurrently (e.g. with asyncio.gather).
+        """
+        return await asyncio.to_thread(self.search_hybrid, query, top_k)
+    
+    @staticmethod
+    def _top_k_order(scores: np.ndarray, k: int) -> np.ndarray:
+        """
+        Returns the positions of the k highest scores, best first; ties keep
+        their input order. Uses a partial selection, so only the selected
+        entries (and ties with the k-th score) are sorted.
+        """
+        if len(scores) > k:
+            kth = len(scores) - k
+            threshold = np.partition(scores, kth)[kth]
+            candidates = np.flatnonzero(scores >= threshold)
+        else:
+            candidates = np.arange(len(scores))
+        return candidates[np.argsort(-scores[candidates], kind="stable")][:k]
+    
+    @staticmethod
+    def dedup_top_k(chunk_ids: np.ndarray, similarities: np.ndarray, k: int) -> np.ndarray:
+        """
+        Deduplicates results by chunk id keeping the best similarity, and selects the top k.
         
-        return results[:top_k]
+        Args:
+            chunk_ids: Chunk id of each result
+            similarities: Similarity of each result
+            k: Number of results to keep
+            
+        Returns:
+            Positions (into the input arrays) of the top k unique results, best first
+        """
+        if len(chunk_ids) == 0:
+            return np.empty(0, dtype=np.int64)
+        
+        # Group by id with the best similarity first, then keep the first row of each group
+        order = np.lexsort((-similarities, chunk_ids))
+        sorted_ids = chunk_ids[order]
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = sorted_ids[1:] != sorted_ids[:-1]
+        best = order[first]
+        
+        # Partial selection of the top k, then sort only those
+        if len(best) > k:
+            best = best[np.argpartition(-similarities[best], k - 1)[:k]]
+        return best[np.argsort(-similarities[best], kind="stable")]
     
     def get_images_for_page(self, page_num: int) -> List[Dict]:
         """
@@ -391,26 +873,56 @@ class PDFIndexer:
             Path where the image was saved or None if there's an error
         """
         try:
-            doc = fitz.open(pdf_path)
-            page = doc[page_num - 1]  # Convert to 0-indexed
-            
-            # Extract image
-            image = doc.extract_image(image_xref)
-            image_bytes = image["image"]
-            image_ext = image["ext"]
-            
-            # Generate filename if not provided
-            if output_path is None:
-                Config.IMAGES_PATH.mkdir(parents=True, exist_ok=True)
-                output_path = Config.IMAGES_PATH / f"page_{page_num}_img_{image_xref}.{image_ext}"
-            
-            # Save image
-            with open(output_path, "wb") as f:
-                f.write(image_bytes)
-            
-            doc.close()
-            return output_path
+            with _PDF_LOCK:
+                image = _open_pdf(str(pdf_path)).extract_image(image_xref)
+            return self._save_image(image, page_num, image_xref, output_path)
         except Exception as e:
             print(f"⚠️ Error extracting image: {e}")
             return None
+    
+    def extract_images_batch(self, pdf_path: Path, items: List[Tuple[int, int]]) -> List[Optional[Path]]:
+        """
+        Extracts several images from the PDF (e.g. all images of a page) in one pass.
+        
+        Args:
+            pdf_path: Path to PDF
+            items: (page_number, image_xref) pairs, page numbers 1-indexed
+            
+        Returns:
+            Path where each image was saved (None for images that failed), in input order
+        """
+        try:
+            with _PDF_LOCK:
+                doc = _open_pdf(str(pdf_path))
+                # The same image can appear on several pages: extract it once
+                images = {}
+                for _, image_xref in items:
+                    if image_xref not in images:
+                        try:
+                            images[image_xref] = doc.extract_image(image_xref)
+                        except Exception as e:
+                            print(f"⚠️ Error extracting image {image_xref}: {e}")
+                            images[image_xref] = None
+        except Exception as e:
+            print(f"⚠️ Error opening PDF: {e}")
+            return [None] * len(items)
+        
+        paths = []
+        for page_num, image_xref in items:
+            image = images[image_xref]
+            paths.append(self._save_image(image, page_num, image_xref) if image else None)
+        return paths
+    
+    @staticmethod
+    def _save_image(image: Dict, page_num: int, image_xref: int, output_path: Optional[Path] = None) -> Path:
+        """Writes an image returned by extract_image() and returns its path."""
+        # Generate filename if not provided
+        if output_path is None:
+            Config.IMAGES_PATH.mkdir(parents=True, exist_ok=True)
+            output_path = Config.IMAGES_PATH / f"page_{page_num}_img_{image_xref}.{image['ext']}"
+        
+        # Save image
+        with open(output_path, "wb") as f:
+            f.write(image["image"])
+        return output_path
 
@@ -0,0 +1,232 @@
+"""
+Caches for tool responses.
+Exact-match LRU cache, a semantic (embedding similarity) cache for near-duplicate
+queries, and an on-disk SQLite cache that persists across runs.
+All caches are thread-safe (tools may run in worker threads).
+"""
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_WORD_RE = re.compile(r"\w+")
+
+# Function words ignored by query_terms() (English and Spanish)
+_STOPWORDS = frozenset((
+    "a", "an", "the", "of", "to", "in", "on", "for", "with", "and", "or", "is", "are",
+    "how", "what", "do", "does", "i", "my", "can", "should",
+    "el", "la", "los", "las", "un", "una", "de", "del", "en", "con", "por", "para",
+    "y", "o", "que", "como", "cómo", "qué", "es", "se", "mi", "mis", "al", "lo"
+))
+
+
+def normalize_query(query: str) -> str:
+    """Normalizes a query for cache lookups (case and whitespace insensitive)."""
+    return _WHITESPACE_RE.sub(" ", query.strip().lower())
+
+
+def query_terms(query: str) -> frozenset:
+    """
+    Returns the content words of a query (lowercase, without function words).
+    Used to scope semantic cache lookups: paraphrases that differ in a key term
+    ("front" vs "rear") can still embed almost identically.
+    """
+    return frozenset(_WORD_RE.findall(query.lower())) - _STOPWORDS
+
+
+class QueryCache:
+    """Exact-match LRU cache for tool responses, with optional expiry."""
+    
+    def __init__(self, maxsize: int = 256, ttl: Optional[float] = None):
+        """
+        Initializes the cache.
+        
+        Args:
+            maxsize: Maximum number of entries kept (least recently used are evicted)
+            ttl: Seconds an entry stays valid (None or 0 keeps entries until evicted)
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Returns the cached value for key, or None if not cached or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, value = entry
+            if self.ttl and time.monotonic() - stored_at >= self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+    
+    def put(self, key: Hashable, value: Any) -> None:
+        """Stores a value, evicting the least recently used entry if full."""
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+    
+    def clear(self) -> None:
+        """Removes all entries."""
+        with self._lock:
+            self._entries.clear()
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SemanticQueryCache:
+    """
+    Cache for near-duplicate queries.
+    Matches incoming query embeddings against cached ones by cosine similarity.
+    """
+    
+    def __init__(self, maxsize: int = 256, threshold: float = 0.92):
+        """
+        Initializes the cache.
+        
+        Args:
+            maxsize: Maximum number of entries kept (oldest are evicted)
+            threshold: Minimum cosine similarity to consider a query a hit
+        """
+        self.maxsize = maxsize
+        self.threshold = threshold
+        self._embeddings: Optional[np.ndarray] = None  # (n, dim) L2-normalized rows
+        self._keys: List[Hashable] = []
+        self._values: List[Any] = []
+        # Rows, keys and values are updated together
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _normalize(embedding: np.ndarray) -> np.ndarray:
+        embedding = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(embedding)
+        return embedding / norm if norm > 0 else embedding
+    
+    def get(self, embedding: np.ndarray, key: Hashable = None) -> Optional[Any]:
+        """
+        Returns the value cached for the most similar query, or None.
+        
+        Args:
+            embedding: Query embedding
+            key: Optional scope key (e.g. vehicle); only entries with the same key match
+        """
+        query = self._normalize(embedding)
+        with self._lock:
+            if self._embeddings is None or not self._values:
+                return None
+            
+            similarities = self._embeddings @ query
+            in_scope = np.fromiter((k == key for k in self._keys), dtype=bool, count=len(self._keys))
+            similarities = np.where(in_scope, similarities, -1.0)
+            best = int(np.argmax(similarities))
+            if similarities[best] >= self.threshold:
+                return self._values[best]
+            return None
+    
+    def put(self, embedding: np.ndarray, value: Any, key: Hashable = None) -> None:
+        """Stores a value for the given query embedding."""
+        if self.maxsize <= 0:
+            return
+        row = self._normalize(embedding)[np.newaxis, :]
+        with self._lock:
+            if self._embeddings is None:
+                self._embeddings = row
+            else:
+                self._embeddings = np.vstack([self._embeddings, row])
+            self._keys.append(key)
+            self._values.append(value)
+            
+            # Evict oldest entries
+            if len(self._values) > self.maxsize:
+                excess = len(self._values) - self.maxsize
+                self._embeddings = self._embeddings[excess:]
+                del self._keys[:excess]
+                del self._values[:excess]
+    
+    def clear(self) -> None:
+        """Removes all entries."""
+        with self._lock:
+            self._embeddings = None
+            self._keys.clear()
+            self._values.clear()
+    
+    def __len__(self) -> int:
+        return len(self._values)
+
+
+class SQLiteQueryCache:
+    """
+    Persistent cache for string responses, stored in a SQLite database.
+    Lets separate processes (e.g. repeated CLI runs) reuse earlier results.
+    """
+    
+    def __init__(self, path: Path, ttl: Optional[float] = None):
+        """
+        Opens (or creates) the cache database.
+        
+        Args:
+            path: SQLite database file
+            ttl: Seconds an entry stays valid (None or 0 keeps entries forever)
+        """
+        self.path = Path(path)
+        self.ttl = ttl
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        
+        # One connection shared by the sync and async search paths (which may run
+        # on different threads), serialized by a lock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS query_cache("
+                "key TEXT PRIMARY KEY, ts REAL NOT NULL, value TEXT NOT NULL)"
+            )
+    
+    @staticmethod
+    def _hash_key(key: Hashable) -> str:
+        return hashlib.blake2b(repr(key).encode("utf-8"), digest_size=16).hexdigest()
+    
+    def get(self, key: Hashable) -> Optional[str]:
+        """Returns the cached value for key, or None if not cached or expired."""
+        min_ts = time.time() - self.ttl if self.ttl else float("-inf")
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM query_cache WHERE key = ? AND ts > ?",
+                (self._hash_key(key), min_ts)
+            ).fetchone()
+        return row[0] if row else None
+    
+    def put(self, key: Hashable, value: str) -> None:
+        """Stores a value (replacing any previous one for the key)."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO query_cache(key, ts, value) VALUES (?, ?, ?)",
+                (self._hash_key(key), time.time(), value)
+            )
+    
+    def clear(self) -> None:
+        """Removes all entries."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM query_cache")
+    
+    def close(self) -> None:
+        """Closes the database connection."""
+        with self._lock:
+            self._conn.close()
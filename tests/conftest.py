@@ -0,0 +1,9 @@
+"""
+Test configuration.
+The modules use flat imports (from config import Config), so the package
+directory is put on the import path.
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,44 @@
+"""Tests for the manual search tool caches."""
+import asyncio
+
+import numpy as np
+
+import agent_tools
+
+
+class _FakeIndexer:
+    """Indexer whose queries all embed identically, returning one hit per query."""
+    
+    def encode_query(self, query):
+        return np.ones(8, dtype=np.float32)
+    
+    async def asearch_hybrid(self, query, top_k=None):
+        return [{"chunk_id": len(query), "page": len(query), "text": query, "similarity": 0.9}]
+    
+    @staticmethod
+    def dedup_top_k(chunk_ids, similarities, k):
+        return np.argsort(-similarities, kind="stable")[:k]
+    
+    def get_images_for_page(self, page_num):
+        return []
+
+
+def test_semantic_cache_does_not_mix_key_terms(monkeypatch):
+    monkeypatch.setattr(agent_tools, "pdf_indexer", _FakeIndexer())
+    agent_tools.clear_caches()
+    
+    front = asyncio.run(agent_tools.asearch_manual("replace front brake pads"))
+    rear = asyncio.run(agent_tools.asearch_manual("replace rear brake pads"))
+    
+    assert "front brake pads" in front
+    assert "rear brake pads" in rear
+
+
+def test_semantic_cache_reuses_rewordings(monkeypatch):
+    monkeypatch.setattr(agent_tools, "pdf_indexer", _FakeIndexer())
+    agent_tools.clear_caches()
+    
+    first = asyncio.run(agent_tools.asearch_manual("replace front brake pads"))
+    reworded = asyncio.run(agent_tools.asearch_manual("how do I replace the front brake pads"))
+    
+    assert reworded == first
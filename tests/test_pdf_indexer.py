@@ -0,0 +1,102 @@
+"""Tests for the PDF indexer."""
+import numpy as np
+import pytest
+
+faiss = pytest.importorskip("faiss")
+pdf_indexer = pytest.importorskip("pdf_indexer")
+
+from config import Config
+
+
+@pytest.fixture
+def vector_store(tmp_path, monkeypatch):
+    """Points the index files at a temporary vector store."""
+    for name in ("INDEX_PATH", "METADATA_PATH", "LEGACY_METADATA_PATH", "IMAGES_METADATA_PATH",
+                 "LEGACY_IMAGES_METADATA_PATH", "KEYWORD_INDEX_PATH", "INDEX_READY_PATH"):
+        monkeypatch.setattr(Config, name, tmp_path / getattr(Config, name).name)
+    return tmp_path
+
+
+@pytest.fixture
+def indexer(monkeypatch):
+    """Indexer without an embedding model (the tests don't encode text)."""
+    monkeypatch.setattr(pdf_indexer, "_configure_torch_threads", lambda: None)
+    monkeypatch.setattr(pdf_indexer, "_load_embedding_model", lambda: None)
+    monkeypatch.setattr(Config, "USE_GPU", False)
+    return pdf_indexer.PDFIndexer()
+
+
+def _embeddings(count: int, dimension: int = 64) -> np.ndarray:
+    embeddings = np.random.default_rng(0).standard_normal((count, dimension)).astype(np.float32)
+    faiss.normalize_L2(embeddings)
+    return embeddings
+
+
+def test_load_index_memory_maps_ivf_index(vector_store, indexer, monkeypatch, capsys):
+    monkeypatch.setattr(Config, "INDEX_IVF_MIN_CHUNKS", 100)
+    embeddings = _embeddings(2000)
+    index = pdf_indexer.PDFIndexer._create_index(len(embeddings), iter([embeddings]))
+    assert isinstance(index, faiss.IndexIVFPQ)
+    
+    indexer.index = index
+    indexer.metadata = pdf_indexer.ChunkStore.from_chunks([
+        {"text": f"chunk {i}", "page": i + 1, "start_pos": 0, "end_pos": 7} for i in range(len(embeddings))
+    ])
+    indexer.save_index()
+    capsys.readouterr()
+    
+    indexer.load_index()
+    
+    output = capsys.readouterr().out
+    assert "Index memory-mapped" in output
+    assert "can't be memory-mapped" not in output
+    assert indexer.index.ntotal == len(embeddings)
+    _, ids = indexer.index.search(embeddings[:1], 1)
+    assert ids[0][0] >= 0
+
+
+def test_load_index_memory_maps_flat_index(vector_store, indexer, capsys):
+    embeddings = _embeddings(50)
+    indexer.index = pdf_indexer.PDFIndexer._create_index(len(embeddings), iter([embeddings]))
+    indexer.metadata = pdf_indexer.ChunkStore.from_chunks([
+        {"text": f"chunk {i}", "page": i + 1, "start_pos": 0, "end_pos": 7} for i in range(len(embeddings))
+    ])
+    indexer.save_index()
+    capsys.readouterr()
+    
+    indexer.load_index()
+    
+    assert "Index memory-mapped" in capsys.readouterr().out
+    _, ids = indexer.index.search(embeddings[:1], 1)
+    assert ids[0][0] == 0
+
+
+
+class _CatalyticBlindModel:
+    """Embedding model that maps every text mentioning "catalytic" to one vector, the rest to another."""
+    
+    def encode(self, texts, **kwargs):
+        embeddings = np.zeros((len(texts), 8), dtype=np.float32)
+        for row, text in enumerate(texts):
+            embeddings[row, 1 if "catalytic" in text.lower() else 0] = 1.0
+        return embeddings
+
+
+def test_hybrid_search_does_not_reuse_keyword_matches(indexer, monkeypatch):
+    monkeypatch.setattr(Config, "SIMILARITY_THRESHOLD", 0.5)
+    texts = ["P0420 code catalytic converter", "P0430 code catalytic converter", "brake pads"]
+    indexer.embedding_model = _CatalyticBlindModel()
+    indexer.index = pdf_indexer.PDFIndexer._create_index(
+        len(texts), indexer.iter_embeddings([{"text": text} for text in texts])
+    )
+    indexer.metadata = pdf_indexer.ChunkStore.from_chunks([
+        {"text": text, "page": i + 1, "start_pos": 0, "end_pos": len(text)} for i, text in enumerate(texts)
+    ])
+    
+    # Both queries embed identically, so the second reuses the first's semantic results
+    first = indexer.search_hybrid("P0420 code", top_k=3)
+    second = indexer.search_hybrid("P0430 code", top_k=3)
+    
+    best_keyword = lambda results: next(r["text"] for r in results if r["type"] == "keyword")
+    assert best_keyword(first) == "P0420 code catalytic converter"
+    assert best_keyword(second) == "P0430 code catalytic converter"